@@ -6,10 +6,10 @@ class Agent(object):
         self.matching_policy = matching_policy
         self.dispatch_policy = dispatch_policy
 
-    def get_commands(self, current_time, vehicles, requests):
+    def get_commands(self, current_time, vehicles, requests, vehicle_index=None):
         matching_commands = []
         if len(requests) > 0:
-            matching_commands = self.matching_policy.match(current_time, vehicles, requests)
+            matching_commands = self.matching_policy.match(current_time, vehicles, requests, vehicle_index)
             vehicles = self.update_vehicles(vehicles, matching_commands)
 
         dispatch_commands = self.dispatch_policy.dispatch(current_time, vehicles)
@@ -8,6 +8,9 @@ class DispatchPolicy(object):
         # self.demand_predictor = DemandPredictionService()
         self.updated_at = {}
 
+    def reset(self):
+        self.updated_at = {}
+
     def dispatch(self, current_time, vehicles):
         self.update_state(current_time, vehicles)
         tbd_vehicles = self.get_tbd_vehicles(vehicles, current_time)
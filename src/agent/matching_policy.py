@@ -1,12 +1,12 @@
 import numpy as np
 from common import vehicle_status_codes, mesh
-from common.geoutils import great_circle_distance
-from collections import defaultdict
-from config.settings import MAP_WIDTH, MAP_HEIGHT
+from config.settings import MAP_HEIGHT
 from simulator.services.routing_service import RoutingEngine
+from simulator.models.vehicle.vehicle_index import VehicleIndex
+from agent.services import assignment_service
 
 class MatchingPolicy(object):
-    def match(self, current_time, vehicles, requests):
+    def match(self, current_time, vehicles, requests, vehicle_index=None):
         return []
 
     def find_available_vehicles(self, vehicles):
@@ -17,6 +17,12 @@ class MatchingPolicy(object):
         ]
         return idle_vehicles
 
+    def get_vehicle_index(self, vehicles, vehicle_index):
+        """Index of available vehicles; built from vehicles when the simulator does not provide one"""
+        if vehicle_index is None:
+            vehicle_index = VehicleIndex.from_frame(self.find_available_vehicles(vehicles))
+        return vehicle_index
+
     def create_command(self, vehicle_id, customer_id, duration):
         command = {}
         command["vehicle_id"] = vehicle_id
@@ -29,23 +35,21 @@ class RoughMatchingPolicy(MatchingPolicy):
     def __init__(self, reject_distance=5000):
         self.reject_distance = reject_distance # meters
 
-    def match(self, current_time, vehicles, requests):
+    def match(self, current_time, vehicles, requests, vehicle_index=None):
         assignments = []
-        vehicles = self.find_available_vehicles(vehicles)
-        n_vehicles = len(vehicles)
+        vehicle_index = self.get_vehicle_index(vehicles, vehicle_index)
+        n_vehicles = len(vehicle_index)
         if n_vehicles == 0:
             return assignments
-        d = great_circle_distance(vehicles.lat.values, vehicles.lon.values,
-                                  requests.origin_lat.values[:, None], requests.origin_lon.values[:, None])
-        for ridx, request_id in enumerate(requests.index):
-            vidx = d[ridx].argmin()
-            if d[ridx, vidx] < self.reject_distance:
-                vehicle_id = vehicles.index[vidx]
-                duration = d[ridx, vidx] / 8.0
-                assignments.append(self.create_command(vehicle_id, request_id, duration))
-                d[:, vidx] = float('inf')
-            else:
+        assigned_vids = set()
+        for request_id, lat, lon in zip(requests.index, requests.origin_lat.values, requests.origin_lon.values):
+            vids, _, d = vehicle_index.knn(lat, lon, 1, self.reject_distance, assigned_vids)
+            if len(vids) == 0:
                 continue
+            vehicle_id = vids[0]
+            duration = d[0] / 8.0
+            assignments.append(self.create_command(vehicle_id, request_id, duration))
+            assigned_vids.add(vehicle_id)
             if len(assignments) == n_vehicles:
                 return assignments
         return assignments
@@ -58,31 +62,22 @@ class GreedyMatchingPolicy(MatchingPolicy):
         self.k = 3                              # the number of mesh to aggregate
         self.unit_length = 500                  # mesh size in meters
         self.max_locations = 40                 # max number of origin/destination points
+        self.max_rounds = 5                     # max number of batched ETA phases in a step
         self.routing_engine = RoutingEngine.create_engine()
 
 
-    def get_coord(self, lon, lat):
-        x, y = mesh.convert_lonlat_to_xy(lon, lat)
-        return (int(x / self.k), int(y / self.k))
-
-    def coord_iter(self):
-        for x in range(int(MAP_WIDTH / self.k)):
-            for y in range(int(MAP_HEIGHT / self.k)):
-                yield (x, y)
-
-
-    def find_candidates(self, coord, n_requests, V, reject_range):
-        x, y = coord
-        candidate_vids = V[(x, y)][:]
-        for r in range(1, reject_range):
-            for dx in range(-r, r + 1):
-                for dy in range(-r, r + 1):
-                    r_2 = dx ** 2 + dy ** 2
-                    if r ** 2 <= r_2 and r_2 < (r + 1) ** 2:
-                        candidate_vids += V[(x + dx, y + dy)][:]
-                if len(candidate_vids) > n_requests * 2:
-                    break
-        return candidate_vids
+    def create_blocks(self, requests):
+        """Groups requests by aggregated mesh and splits the groups into blocks of max_locations"""
+        cx = mesh.lon2X(requests.origin_lon.values) // self.k
+        cy = mesh.lat2Y(requests.origin_lat.values) // self.k
+        order = np.lexsort((cy, cx))
+        keys = cx[order].astype(np.int64) * MAP_HEIGHT + cy[order]
+        blocks = []
+        for group in np.split(order, np.flatnonzero(np.diff(keys)) + 1):
+            rids = requests.index.values[group].tolist()
+            for i in range(0, len(rids), self.max_locations):
+                blocks.append(rids[i : i + self.max_locations])
+        return blocks
 
     def assign_nearest_vehicle(self, request_ids, vehicle_ids, T):
         assignments = []
@@ -99,69 +94,144 @@ class GreedyMatchingPolicy(MatchingPolicy):
             T[:, vi] = float('inf')
         return assignments
 
-    def filter_candidates(self, vehicles, requests):
-        d = great_circle_distance(vehicles.lat.values, vehicles.lon.values,
-                                  requests.origin_lat.mean(), requests.origin_lon.mean())
-
-        within_limit_distance = d < self.reject_distance + self.unit_length * (self.k - 1)
-        candidates = vehicles.index[within_limit_distance]
-        d = d[within_limit_distance]
-        return candidates[np.argsort(d)[:2 * len(requests) + 1]].tolist()
+    def create_subproblems(self, blocks, vehicle_index, r_latlon, assigned_vids):
+        """Returns (target request ids, target latlons, candidate vehicle ids, candidate latlons) of each block.
+        Candidates are the vehicles nearest to the center of the block which are not assigned yet."""
+        limit_distance = self.reject_distance + self.unit_length * (self.k - 1)
+        subproblems = []
+        for target_rids in blocks:
+            target_latlon = r_latlon.loc[target_rids].values
+            lat, lon = target_latlon.mean(axis=0)
+            candidate_vids, candidate_latlon, _ = vehicle_index.knn(
+                lat, lon, 2 * len(target_rids) + 1, limit_distance, assigned_vids)
+            if len(candidate_vids) == 0:
+                continue
+            subproblems.append((target_rids, target_latlon, candidate_vids.tolist(), candidate_latlon))
+        return subproblems
 
 
-    def match(self, current_time, vehicles, requests):
+    def match(self, current_time, vehicles, requests, vehicle_index=None):
         commands = []
-        vehicles = self.find_available_vehicles(vehicles)
-        n_vehicles = len(vehicles)
-        if n_vehicles == 0:
+        vehicle_index = self.get_vehicle_index(vehicles, vehicle_index)
+        if len(vehicle_index) == 0:
             return commands
 
-        v_latlon = vehicles[["lat", "lon"]]
-        V = defaultdict(list)
-        vid2coord = {}
-        for vid, row in v_latlon.iterrows():
-            coord = self.get_coord(row.lon, row.lat)
-            vid2coord[vid] = coord
-            V[coord].append(vid)
-
         r_latlon = requests[["origin_lat", "origin_lon"]]
-        R = defaultdict(list)
-        for rid, row in r_latlon.iterrows():
-            coord = self.get_coord(row.origin_lon, row.origin_lat)
-            R[coord].append(rid)
-
-        reject_range = int(self.reject_distance / self.unit_length / self.k) + 1
-        for coord in self.coord_iter():
-            if not R[coord]:
-                continue
-
-            for i in range(int(np.ceil(len(R[coord]) / self.max_locations))):
-                target_rids = R[coord][i * self.max_locations : (i + 1) * self.max_locations]
+        blocks = self.create_blocks(requests)
+
+        # ETAs of all blocks are resolved in one batch per round. Blocks whose candidates were taken by
+        # preceding blocks are deferred to the next round with the remaining vehicles, except in the last round
+        assigned_vids = set()
+        for i_round in range(self.max_rounds):
+            subproblems = self.create_subproblems(blocks, vehicle_index, r_latlon, assigned_vids)
+            if not subproblems:
+                break
 
-                candidate_vids = self.find_candidates(coord, len(target_rids), V, reject_range)
-                if len(candidate_vids) == 0:
+            blocks = []
+            ETAs = self.eta_matrices([(candidate_latlon, target_latlon)
+                                      for _, target_latlon, _, candidate_latlon in subproblems])
+            for (target_rids, _, candidate_vids, _), T in zip(subproblems, ETAs):
+                taken = [vi for vi, vid in enumerate(candidate_vids) if vid in assigned_vids]
+                if taken and i_round < self.max_rounds - 1:
+                    blocks.append(target_rids)
                     continue
 
-                target_latlon = r_latlon.loc[target_rids]
-                candidate_vids = self.filter_candidates(v_latlon.loc[candidate_vids], target_latlon)
-                if len(candidate_vids) == 0:
-                    continue
-                candidate_latlon = v_latlon.loc[candidate_vids]
-                T = self.eta_matrix(candidate_latlon, target_latlon)
-                assignments = self.assign_nearest_vehicle(target_rids, candidate_vids, T.T)
+                T = T.T
+                T[:, taken] = float('inf')
+                assignments = self.assign_nearest_vehicle(target_rids, candidate_vids, T)
                 for vid, rid, tt in assignments:
                     commands.append(self.create_command(vid, rid, tt))
-                    V[vid2coord[vid]].remove(vid)
+                    assigned_vids.add(vid)
 
         return commands
 
 
+    def eta_matrices(self, latlon_pairs):
+        """Returns ETA matrices of a list of (origins, destins) latlon arrays in one routing engine call"""
+        problems = []
+        origin_indices = []
+        for origins_array, destins_array in latlon_pairs:
+            destins = [(lat, lon) for lat, lon in destins_array]
+            origins = [(lat, lon) for lat, lon in origins_array]
+            origin_set = list(set(origins))
+            latlon2oi = {latlon: oi for oi, latlon in enumerate(origin_set)}
+            problems.append((origin_set, destins))
+            origin_indices.append([latlon2oi[latlon] for latlon in origins])
+
+        ETAs = []
+        for T, oi in zip(self.routing_engine.eta_many_to_many_batch(problems), origin_indices):
+            T = np.array(T, dtype=np.float32)
+            T[np.isnan(T)] = float('inf')
+            ETAs.append(T[oi])
+        return ETAs
+
     def eta_matrix(self, origins_array, destins_array):
-        destins = [(lat, lon) for lat, lon in destins_array.values]
-        origins = [(lat, lon) for lat, lon in origins_array.values]
-        origin_set = list(set(origins))
-        latlon2oi = {latlon: oi for oi, latlon in enumerate(origin_set)}
-        T = np.array(self.routing_engine.eta_many_to_many(origin_set, destins), dtype=np.float32)
-        T[np.isnan(T)] = float('inf')
-        T = T[[latlon2oi[latlon] for latlon in origins]]
-        return T
\ No newline at end of file
+        return self.eta_matrices([(origins_array.values, destins_array.values)])[0]
+
+
+class OptimalMatchingPolicy(GreedyMatchingPolicy):
+    """Assigns as many requests as possible with the least total pickup time.
+    ETAs of candidates within reject_wait_time form a sparse bipartite graph of requests and vehicles,
+    and each connected component of the graph is solved as a dense assignment problem. Requests left unassigned
+    are solved again with the next nearest vehicles for up to max_rounds."""
+
+    def __init__(self, reject_distance=5000, max_edges=20):
+        super().__init__(reject_distance)
+        self.max_edges = max_edges              # number of nearest vehicles by ETA kept per request
+
+    def match(self, current_time, vehicles, requests, vehicle_index=None):
+        commands = []
+        vehicle_index = self.get_vehicle_index(vehicles, vehicle_index)
+        if len(vehicle_index) == 0:
+            return commands
+
+        r_latlon = requests[["origin_lat", "origin_lon"]]
+        blocks = self.create_blocks(requests)
+        assigned_vids = set()
+        for _ in range(self.max_rounds):
+            subproblems = self.create_subproblems(blocks, vehicle_index, r_latlon, assigned_vids)
+            if not subproblems:
+                break
+            ETAs = self.eta_matrices([(candidate_latlon, target_latlon)
+                                      for _, target_latlon, _, candidate_latlon in subproblems])
+            assignments = self.assign_optimal_vehicles(subproblems, ETAs)
+            if not assignments:
+                break
+
+            assigned_rids = set()
+            for vid, rid, tt in assignments:
+                commands.append(self.create_command(vid, rid, tt))
+                assigned_vids.add(vid)
+                assigned_rids.add(rid)
+            blocks = [[rid for rid in target_rids if rid not in assigned_rids] for target_rids, _, _, _ in subproblems]
+            blocks = [target_rids for target_rids in blocks if target_rids]
+
+        return commands
+
+    def assign_optimal_vehicles(self, subproblems, ETAs):
+        """Returns (vehicle id, request id, ETA) of the optimal assignment on the union of subproblems"""
+        request_ids, vehicle_ids = [], []
+        vid2col = {}
+        rows, cols, costs = [], [], []
+        for (target_rids, _, candidate_vids, _), T in zip(subproblems, ETAs):
+            T = T.T
+            if T.shape[1] > self.max_edges:
+                nearest = np.argpartition(T, self.max_edges - 1, axis=1)[:, :self.max_edges]
+                pruned = np.full_like(T, float('inf'))
+                np.put_along_axis(pruned, nearest, np.take_along_axis(T, nearest, axis=1), axis=1)
+                T = pruned
+            ri, vi = np.nonzero(T <= self.reject_wait_time)
+            block_cols = []
+            for vid in candidate_vids:
+                if vid not in vid2col:
+                    vid2col[vid] = len(vehicle_ids)
+                    vehicle_ids.append(vid)
+                block_cols.append(vid2col[vid])
+            rows.append(ri + len(request_ids))
+            cols.append(np.array(block_cols, dtype=np.int64)[vi])
+            costs.append(T[ri, vi])
+            request_ids.extend(target_rids)
+
+        rows, cols, costs = np.concatenate(rows), np.concatenate(cols), np.concatenate(costs)
+        edges = assignment_service.solve_assignment(rows, cols, costs, len(request_ids), len(vehicle_ids))
+        return [(vehicle_ids[cols[e]], request_ids[rows[e]], costs[e]) for e in edges]
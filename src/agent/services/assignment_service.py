@@ -0,0 +1,57 @@
+"""Optimal assignment on sparse bipartite graphs of requests and vehicles"""
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def find_components(rows, cols, n_rows, n_cols):
+    """Returns component labels of row nodes and column nodes of a bipartite graph with edges (rows, cols)"""
+    a, b = rows, cols + n_rows
+    labels = np.arange(n_rows + n_cols)
+    while True:
+        m = np.minimum(labels[a], labels[b])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, a, m)
+        np.minimum.at(new_labels, b, m)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    _, labels = np.unique(labels, return_inverse=True)
+    return labels[:n_rows], labels[n_rows:]
+
+
+def assign_component(r, c, costs, n_rows, n_cols):
+    """Returns indices of the edges (r, c) assigned in a connected component, solved as a dense block.
+    Pairs without an edge cost more than all edges together, so they are taken only when no edge is left."""
+    edge_ids = np.full((n_rows, n_cols), -1, dtype=np.int64)
+    # the cheapest of parallel edges is written last
+    order = np.argsort(-costs, kind='mergesort')
+    edge_ids[r[order], c[order]] = order
+    block = np.where(edge_ids >= 0, costs[edge_ids], costs.sum() + 1)
+    assigned = edge_ids[linear_sum_assignment(block)]
+    return assigned[assigned >= 0]
+
+
+def solve_assignment(rows, cols, costs, n_rows, n_cols):
+    """Returns indices of edges assigning the most rows to distinct columns with the least total cost.
+    Costs must be non-negative. The graph is solved per connected component."""
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    costs = np.asarray(costs, dtype=np.float64)
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64)
+    row_labels, _ = find_components(rows, cols, n_rows, n_cols)
+    edge_labels = row_labels[rows]
+    order = np.argsort(edge_labels, kind='mergesort')
+    bounds = np.flatnonzero(np.diff(edge_labels[order])) + 1
+
+    selected = []
+    for edges in np.split(order, bounds):
+        component_rows, r = np.unique(rows[edges], return_inverse=True)
+        component_cols, c = np.unique(cols[edges], return_inverse=True)
+        if len(component_rows) == 1 or len(component_cols) == 1:
+            # only one edge can be taken
+            selected.append(edges[costs[edges].argmin()])
+            continue
+        assigned = assign_component(r, c, costs[edges], len(component_rows), len(component_cols))
+        selected.extend(edges[assigned].tolist())
+    return np.array(selected, dtype=np.int64)
@@ -0,0 +1,38 @@
+"""On-disk cache of arrays derived from data files and settings"""
+import os
+import hashlib
+import numpy as np
+from config.settings import CACHE_DIR
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def compute_digest(key):
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+def get_cache_path(name, key):
+    return os.path.join(CACHE_DIR, "{}_{}.npy".format(name, compute_digest(key)[:16]))
+
+
+def load_or_compute(name, key, compute, mmap_mode=None):
+    """Loads an array cached under name and key, or computes and saves it.
+    The file is written to a temporary path first so that concurrent processes never read partial files."""
+    path = get_cache_path(name, key)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode=mmap_mode)
+
+    value = compute()
+    if not os.path.exists(CACHE_DIR):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        np.save(f, value)
+    os.replace(tmp_path, path)
+    return value
@@ -2,8 +2,12 @@ import os
 
 DB_HOST_PATH = "sqlite:///data/db.sqlite3"
 OSRM_HOSTPORT = os.getenv("OSRM_HOSTPORT", "localhost:5000")
+OSRM_CACHE_SIZE = 100000
+OSRM_CACHE_PATH = os.getenv("OSRM_CACHE_PATH") # SQLite file to persist OSRM results across runs
 DEFAULT_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../logs/tmp")
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../data")
+REQUEST_BACKLOG_DIR = os.path.join(DATA_DIR, "request_backlog")
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
 
 CENTER_LATITUDE = 40.75
 CENTER_LONGITUDE = -73.90
@@ -26,6 +30,7 @@ PICKUP_DURATION = 60 * 1
 MIN_WORKING_TIME = 3600 * 20
 MAX_WORKING_TIME = 3600 * 21
 ENTERING_TIME_BUFFER = 3600 * 4
+DEMAND_REPLAY_CHUNK = 3600 * 6 # requests loaded into memory at once by DemandGenerator
 
 DESTINATION_PROFILE_TEMPORAL_AGGREGATION = 3 #hours
 DESTINATION_PROFILE_SPATIAL_AGGREGATION = 5 #(x, y) coordinates
@@ -0,0 +1,89 @@
+"""Training of the dispatch network in a learner process apart from the simulation.
+The acting policy streams transitions and supply demand snapshots to the learner through a queue;
+the learner trains on them continuously and publishes weights which the acting network reloads."""
+import queue
+from config.settings import GLOBAL_STATE_UPDATE_CYCLE
+from .dqn_policy import DQNDispatchPolicyLearner
+from .q_network import ExploringDeepQNetwork
+from .settings import FLAGS
+from .learner_process import LearnerProcess, EXPERIENCE, SUPPLY_DEMAND, DUMP, STOP
+from . import settings
+
+
+def run_learner(message_queue, state_queue, load_network, load_memory, pretrain, batch_size):
+    """Main loop of the learner process: stores received transitions and snapshots,
+    trains the network whenever the replay memory is ready and publishes its state every PUBLISH_INTERVAL steps"""
+    learner = DQNDispatchPolicyLearner()
+    learner.build_q_network(load_network=load_network)
+    if load_memory:
+        learner.load_experience_memory(load_memory)
+    if pretrain > 0:
+        learner.pretrain(pretrain, batch_size)
+    state_queue.put(learner.q_network.get_state())
+
+    while True:
+        training = len(learner.supply_demand_history) > settings.INITIAL_MEMORY_SIZE
+        messages = []
+        if not training:
+            # waits for the memory to be populated
+            messages.append(message_queue.get())
+        while True:
+            try:
+                messages.append(message_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        for kind, data in messages:
+            if kind == EXPERIENCE:
+                learner.experience_memory.extend(data)
+            elif kind == SUPPLY_DEMAND:
+                learner.supply_demand_history.put(*data)
+            elif kind == DUMP:
+                learner.dump_experience_memory()
+            elif kind == STOP:
+                return
+
+        if len(learner.supply_demand_history) > settings.INITIAL_MEMORY_SIZE:
+            learner.learn()
+            if learner.q_network.n_steps % settings.PUBLISH_INTERVAL == 0:
+                state_queue.put(learner.q_network.get_state())
+
+
+class DQNDispatchPolicyActor(DQNDispatchPolicyLearner):
+    """Learner acting in the simulation whose network is trained by a LearnerProcess.
+    Transitions memorized in a step and supply demand snapshots are sent to the learner,
+    and the latest weights it published are loaded before the next step."""
+
+    def __init__(self):
+        super().__init__()
+        self.learner = None
+
+    def build_q_network(self, load_network=None):
+        self.q_network = ExploringDeepQNetwork()
+        self.learner = LearnerProcess(run_learner, load_network, FLAGS.load_memory, FLAGS.pretrain, FLAGS.batch_size)
+        self.q_network.set_state(self.learner.receive_state(block=True))
+
+    def backup_supply_demand(self):
+        current_time = self.feature_constructor.get_current_time()
+
+        if current_time % GLOBAL_STATE_UPDATE_CYCLE == 0:
+            f = self.q_network.get_fingerprint()
+            self.feature_constructor.update_fingerprint(f)
+            self.learner.send_supply_demand(current_time, self.feature_constructor.get_supply_demand_maps(), f)
+
+    def learn(self):
+        # snapshots are sent before transitions ending at them, so the learner never finds them missing
+        if len(self.experience_memory) > 0:
+            self.learner.send_experience(self.experience_memory.get(self.experience_memory.get_ordered_rows()))
+            self.experience_memory.clear()
+
+        state = self.learner.receive_state()
+        if state is not None:
+            self.q_network.set_state(state)
+            self.q_cache = {}
+
+    def dump_experience_memory(self):
+        self.learner.dump_experience_memory()
+
+    def close(self):
+        self.learner.close()
@@ -6,6 +6,8 @@ from .settings import FLAGS
 from config.settings import GLOBAL_STATE_UPDATE_CYCLE, MIN_DISPATCH_CYCLE, DESTINATION_PROFILE_TEMPORAL_AGGREGATION
 from .feature_constructor import FeatureConstructor
 from .q_network import DeepQNetwork, FittingDeepQNetwork
+from .experience_memory import ExperienceMemory
+from .supply_demand_history import SupplyDemandHistory
 from agent.dispatch_policy import DispatchPolicy
 from . import settings
 from common.time_utils import get_local_datetime
@@ -19,6 +21,12 @@ class DQNDispatchPolicy(DispatchPolicy):
         self.q_network = None
         self.q_cache = {}
 
+    def reset(self):
+        """Forgets the state of a simulation so that the policy, with its network, is reused in the next one"""
+        super().reset()
+        self.feature_constructor.reset()
+        self.q_cache = {}
+
 
     def build_q_network(self, load_network=None):
         self.q_network = DeepQNetwork(load_network)
@@ -35,6 +43,12 @@ class DQNDispatchPolicy(DispatchPolicy):
 
     def get_commands(self, tbd_vehicles):
         commands = []
+        if self.q_network is not None:
+            xs = mesh.lon2X(tbd_vehicles.lon.values)
+            ys = mesh.lat2Y(tbd_vehicles.lat.values)
+            cells = set(zip(xs.tolist(), ys.tolist()))
+            self.update_q_cache([l for l in cells if l not in self.q_cache])
+
         for vehicle_id, vehicle_state in tbd_vehicles.iterrows():
             a, offduty = self.predict_best_action(vehicle_id, vehicle_state)
             if offduty:
@@ -59,18 +73,12 @@ class DQNDispatchPolicy(DispatchPolicy):
 
         else:
             x, y = mesh.convert_lonlat_to_xy(vehicle_state.lon, vehicle_state.lat)
-            if (x, y) in self.q_cache:
-                actions, Q, amax = self.q_cache[(x, y)]
-            else:
-                s, actions = self.feature_constructor.construct_current_features(x, y)
-                Q = self.q_network.compute_q_values(s)
-
-                # only considers actions whose values are greater than wait action value
-                wait_action_value = Q[0]
-                actions = [a for a, q in zip(actions, Q) if q >= wait_action_value]
-                Q = Q[Q >= wait_action_value]
-                amax = np.argmax(Q)
-                self.q_cache[(x, y)] = actions, Q, amax
+            if (x, y) not in self.q_cache:
+                self.update_q_cache([(x, y)])
+            if (x, y) not in self.q_cache:
+                # no valid action at this cell
+                return (0, 0), 0
+            actions, Q, amax = self.q_cache[(x, y)]
             # if actions[amax] == (0, 0):
             #     aidx = amax
             # else:
@@ -79,6 +87,25 @@ class DQNDispatchPolicy(DispatchPolicy):
             offduty = 1 if Q[aidx] < FLAGS.offduty_threshold else 0
         return a, offduty
 
+    def update_q_cache(self, cells):
+        """Computes Q values of all actions at cells by one forward pass of the network"""
+        cells = list(cells)
+        sa, cell_actions = self.feature_constructor.construct_current_features(cells)
+        if len(sa) == 0:
+            return
+
+        Q_batch = self.q_network.compute_q_values(sa)
+        bounds = np.cumsum([len(actions) for actions in cell_actions])[:-1]
+        for l, actions, Q in zip(cells, cell_actions, np.split(Q_batch, bounds)):
+            if not actions:
+                continue
+            # only considers actions whose values are greater than wait action value
+            wait_action_value = Q[0]
+            actions = [a for a, q in zip(actions, Q) if q >= wait_action_value]
+            Q = Q[Q >= wait_action_value]
+            amax = np.argmax(Q)
+            self.q_cache[l] = actions, Q, amax
+
 
     def convert_action_to_destination(self, vehicle_state, a):
         cache_key = None
@@ -100,34 +127,43 @@ class DQNDispatchPolicyLearner(DQNDispatchPolicy):
 
     def __init__(self):
         super().__init__()
-        self.supply_demand_history = OrderedDict()
-        self.experience_memory = []
+        self.supply_demand_history = SupplyDemandHistory(settings.NUM_SUPPLY_DEMAND_HISTORY, GLOBAL_STATE_UPDATE_CYCLE)
+        self.experience_memory = ExperienceMemory(settings.MAX_MEMORY_SIZE)
         self.last_state_actions = {}
         self.rewards = defaultdict(int)
         self.last_earnings = defaultdict(int)
 
 
     def reset(self):
+        super().reset()
         self.last_state_actions = {}
         self.rewards = defaultdict(int)
         self.last_earnings = defaultdict(int)
 
     def dump_experience_memory(self):
-        sd_path = os.path.join(FLAGS.save_memory_dir, "sd_history.pkl")
-        sars_path = os.path.join(FLAGS.save_memory_dir, "sars_history.pkl")
-        pickle.dump(self.supply_demand_history, open(sd_path, "wb"))
-        pickle.dump(self.experience_memory, open(sars_path, "wb"))
+        self.supply_demand_history.save(os.path.join(FLAGS.save_memory_dir, "supply_demand"))
+        self.experience_memory.save(os.path.join(FLAGS.save_memory_dir, "experience"))
 
     def load_experience_memory(self, path):
-        sd_path = os.path.join(path, "sd_history.pkl")
-        sars_path = os.path.join(path, "sars_history.pkl")
-        self.supply_demand_history = pickle.load(open(sd_path, "rb"))
-        self.experience_memory = pickle.load(open(sars_path, "rb"))
-
-        state_action, _, _ = self.experience_memory[0]
-        t_start, _, _ = state_action
-        state_action, _, _ = self.experience_memory[-1]
-        t_end, _, _ = state_action
+        sd_path = os.path.join(path, "supply_demand")
+        if SupplyDemandHistory.exists(sd_path):
+            self.supply_demand_history = SupplyDemandHistory.load(sd_path)
+        else:
+            # history dumped as a pickled OrderedDict of t -> (maps, fingerprint)
+            self.supply_demand_history = SupplyDemandHistory(settings.NUM_SUPPLY_DEMAND_HISTORY, GLOBAL_STATE_UPDATE_CYCLE)
+            for t, (sd, f) in pickle.load(open(os.path.join(path, "sd_history.pkl"), "rb")).items():
+                self.supply_demand_history.put(t, sd, f)
+        experience_path = os.path.join(path, "experience")
+        if ExperienceMemory.exists(experience_path):
+            self.experience_memory = ExperienceMemory.load(experience_path, settings.MAX_MEMORY_SIZE)
+        else:
+            # memory dumped as a pickled list of ((t, l, a), (next_t, next_l), reward)
+            sars_path = os.path.join(path, "sars_history.pkl")
+            self.experience_memory = ExperienceMemory(settings.MAX_MEMORY_SIZE)
+            for (t, l, a), (next_t, next_l), reward in pickle.load(open(sars_path, "rb")):
+                self.experience_memory.append(t, l, a, next_t, next_l, reward)
+
+        t_start, t_end = self.experience_memory.get_period()
         print("period: {} ~ {}".format(get_local_datetime(t_start), get_local_datetime(t_end)))
 
 
@@ -156,13 +192,15 @@ class DQNDispatchPolicyLearner(DQNDispatchPolicy):
         self.give_rewards(vehicles)
         commands = super().dispatch(current_time, vehicles)
         self.backup_supply_demand()
+        self.learn()
+        return commands
 
+    def learn(self):
         if len(self.supply_demand_history) > settings.INITIAL_MEMORY_SIZE:
             average_loss, average_q_max = self.train_network(FLAGS.batch_size)
             print("iterations : {}, average_loss : {:.3f}, average_q_max : {:.3f}".format(
                 self.q_network.n_steps, average_loss, average_q_max), flush=True)
             self.q_network.write_summary(average_loss, average_q_max)
-        return commands
 
 
     def backup_supply_demand(self):
@@ -171,17 +209,10 @@ class DQNDispatchPolicyLearner(DQNDispatchPolicy):
         if current_time % GLOBAL_STATE_UPDATE_CYCLE == 0:
             f = self.q_network.get_fingerprint()
             self.feature_constructor.update_fingerprint(f)
-            self.supply_demand_history[current_time] = self.feature_constructor.get_supply_demand_maps(), f
-
-            if len(self.supply_demand_history) > settings.NUM_SUPPLY_DEMAND_HISTORY:
-                self.supply_demand_history.popitem(last=False)
+            self.supply_demand_history.put(current_time, self.feature_constructor.get_supply_demand_maps(), f)
 
     def replay_supply_demand(self, t):
-        t_ = t - (t % GLOBAL_STATE_UPDATE_CYCLE)
-        if t_ in self.supply_demand_history:
-            return self.supply_demand_history[t_]
-        else:
-            return None, None
+        return self.supply_demand_history.get(t)
 
     def memorize_experience(self, vehicle_id, vehicle_state, a):
         t = self.feature_constructor.get_current_time()
@@ -189,12 +220,9 @@ class DQNDispatchPolicyLearner(DQNDispatchPolicy):
         last_state_action = self.last_state_actions.get(vehicle_id, None)
 
         if last_state_action is not None:
-            current_state = (t, l)
+            last_t, last_l, last_a = last_state_action
             reward = self.rewards[vehicle_id]
-
-            if len(self.experience_memory) > settings.MAX_MEMORY_SIZE:
-                self.experience_memory.pop(0)
-            self.experience_memory.append((last_state_action, current_state, reward))
+            self.experience_memory.append(last_t, last_l, last_a, t, l, reward)
 
         self.rewards[vehicle_id] = 0
         self.last_state_actions[vehicle_id] = (t, l, a)
@@ -204,47 +232,85 @@ class DQNDispatchPolicyLearner(DQNDispatchPolicy):
         loss_sum = 0
         q_max_sum = 0
         for _ in range(n_iterations):
-            sa_batch = []
-            y_batch = []
-            for _ in range(batch_size):
-                sa, y = self.replay_memory()
-                sa_batch.append(sa)
-                y_batch.append(y)
-
+            sa_batch, y_batch = self.replay_memory(batch_size)
             loss_sum += self.q_network.fit(sa_batch, y_batch)
             q_max_sum += np.mean(y_batch)
         self.q_network.run_cyclic_updates()
         return loss_sum / n_iterations, q_max_sum / n_iterations
 
 
-    def replay_memory(self, max_retry=100):
-        for _ in range(max_retry):
-            num = np.random.randint(0, len(self.experience_memory) - 1)
-            state_action, next_state, reward = self.experience_memory[num]
-            t, l, a = state_action
-            next_t, next_l = next_state
-            if self.feature_constructor.reachable_map[next_l] == 0:
-                self.experience_memory.pop(num)
-                continue
-            sd, f = self.replay_supply_demand(t)
-            if sd is None:
-                self.experience_memory.pop(num)
-                continue
-            next_sd, next_f = self.replay_supply_demand(next_t)
-            if next_sd is None:
-                self.experience_memory.pop(num)
-                continue
-            a_feature = self.feature_constructor.construct_action_feature(t, l, sd, a)
-            if a_feature is None:
-                self.experience_memory.pop(num)
-                continue
+    def pretrain(self, n_iterations, batch_size):
+        for i in range(n_iterations):
+            average_loss, average_q_max = self.train_network(batch_size)
+            print("iterations : {}, average_loss : {:.3f}, average_q_max : {:.3f}".format(
+                i, average_loss, average_q_max), flush=True)
+            self.q_network.write_summary(average_loss, average_q_max)
 
-            s_feature = self.feature_constructor.construct_state_feature(t, f, l, sd)
-            sa = s_feature + a_feature
-            next_sa, _ = self.feature_constructor.construct_features(next_t, next_f, next_l, next_sd)
-            target_value = self.q_network.compute_target_value(next_sa)
-            discount_factor = settings.GAMMA ** int((next_t - t) / 60)
-            y = reward + discount_factor * target_value
-            return sa, y
+    def replay_memory(self, batch_size, max_retry=100):
+        """Returns state-action features and target values of batch_size random transitions.
+        Features of all transitions are built in bulk per supply demand snapshot and the target values are
+        computed by one pass of each network."""
+        batch = self.sample_experiences(batch_size, max_retry)
+        fc = self.feature_constructor
+        ls = np.stack([batch["x"], batch["y"]], axis=1)
+        actions = np.stack([batch["ax"], batch["ay"]], axis=1)
+        next_ls = np.stack([batch["next_x"], batch["next_y"]], axis=1)
+
+        sa_batch = np.empty((batch_size, settings.NUM_FEATURES), dtype=np.float32)
+        for t, idx in self.group_by(batch["t"].tolist()).items():
+            sd, f = self.replay_supply_demand(t)
+            sa_batch[idx] = fc.construct_action_taken_features(t, f, ls[idx], actions[idx], sd)
 
-        raise Exception
+        next_sa = []
+        next_counts = []
+        next_order = []
+        for next_t, idx in self.group_by(batch["next_t"].tolist()).items():
+            next_sd, next_f = self.replay_supply_demand(next_t)
+            sa, cell_actions = fc.construct_features(next_t, next_f, next_ls[idx].tolist(), next_sd)
+            next_sa.append(sa)
+            next_counts += [len(actions) for actions in cell_actions]
+            next_order += idx
+        target_values = np.empty(batch_size)
+        target_values[next_order] = self.q_network.compute_target_values(np.concatenate(next_sa), next_counts)
+
+        discount_factor = settings.GAMMA ** ((batch["next_t"] - batch["t"]) / 60).astype(int)
+        y_batch = batch["reward"] + discount_factor * target_values
+        return sa_batch, y_batch
+
+    def sample_experiences(self, batch_size, max_retry=100):
+        """Returns columns of batch_size random transitions whose features can be built.
+        Invalid transitions are flagged and dropped from the memory once they make up a tenth of it."""
+        memory = self.experience_memory
+        rows = np.empty(0, dtype=np.int64)
+        for _ in range(max_retry):
+            candidates = memory.sample(batch_size - len(rows))
+            candidates = candidates[memory.valid[candidates]]
+            valid = self.validate_experiences(memory.get(candidates))
+            memory.invalidate(candidates[~valid])
+            rows = np.concatenate([rows, candidates[valid]])
+            if len(rows) == batch_size:
+                break
+        else:
+            raise RuntimeError("Not enough valid experiences in memory: sampled {} of {} transitions in {} tries, "
+                               "{} of {} are invalid".format(len(rows), batch_size, max_retry,
+                                                             memory.n_invalid, len(memory)))
+
+        batch = memory.get(rows)
+        if memory.n_invalid * 10 > len(memory):
+            memory.compact()
+        return batch
+
+    def validate_experiences(self, batch):
+        fc = self.feature_constructor
+        ls = (batch["x"], batch["y"])
+        next_ls = (batch["next_x"], batch["next_y"])
+        return ((fc.reachable_map[next_ls] == 1) & fc.is_valid_action(ls, (batch["ax"], batch["ay"]))
+                & (fc.count_actions(next_ls) > 0)
+                & self.supply_demand_history.contains(batch["t"]) & self.supply_demand_history.contains(batch["next_t"]))
+
+    def group_by(self, keys):
+        """Indices of keys grouped by key"""
+        groups = OrderedDict()
+        for i, key in enumerate(keys):
+            groups.setdefault(key, []).append(i)
+        return groups
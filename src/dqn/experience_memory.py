@@ -0,0 +1,148 @@
+"""Replay memory of dispatch transitions stored in typed columns.
+Each column is saved as a .npy file and opened with np.memmap on load, so that pretraining
+starts without reading the whole memory."""
+import os
+import json
+import numpy as np
+
+META_FILE = "meta.json"
+
+
+class ExperienceMemory(object):
+    """Fixed-capacity ring buffer of transitions (t, l, a) -> (next_t, next_l) with reward.
+    Columns grow up to capacity, after which each new transition overwrites the oldest one.
+    Transitions found invalid in replay are flagged and dropped by compact."""
+
+    columns = [
+        ('t', np.int32),
+        ('x', np.int16),
+        ('y', np.int16),
+        ('ax', np.int16),
+        ('ay', np.int16),
+        ('next_t', np.int32),
+        ('next_x', np.int16),
+        ('next_y', np.int16),
+        ('reward', np.float32),
+        ('valid', np.bool_)
+    ]
+
+    def __init__(self, capacity, initial_capacity=1024):
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0           # row of the oldest transition once the buffer is full
+        self.n_invalid = 0
+        for name, dtype in self.columns:
+            setattr(self, name, np.zeros(min(capacity, initial_capacity), dtype=dtype))
+
+    def __len__(self):
+        return self.size
+
+    def append(self, t, l, a, next_t, next_l, reward):
+        if self.size < self.capacity:
+            if self.size == len(self.t):
+                self.__grow()
+            row = self.size
+            self.size += 1
+        else:
+            row = self.head
+            self.head = (self.head + 1) % self.capacity
+            if not self.valid[row]:
+                self.n_invalid -= 1
+        self.t[row] = t
+        self.x[row], self.y[row] = l
+        self.ax[row], self.ay[row] = a
+        self.next_t[row] = next_t
+        self.next_x[row], self.next_y[row] = next_l
+        self.reward[row] = reward
+        self.valid[row] = True
+
+    def extend(self, batch):
+        """Appends transitions given as a dict of columns, as returned by get"""
+        n = len(batch['t'])
+        n_tail = min(n, self.capacity - self.size)
+        while self.size + n_tail > len(self.t):
+            self.__grow()
+        # rows each transition would take if appended one by one
+        rows = np.concatenate([np.arange(self.size, self.size + n_tail),
+                               (self.head + np.arange(n - n_tail)) % self.capacity])
+        # only the last capacity transitions survive
+        skip = max(n - self.capacity, 0)
+        rows = rows[skip:]
+        self.n_invalid -= int(np.count_nonzero(~self.valid[rows[rows < self.size]]))
+        for name, _ in self.columns:
+            getattr(self, name)[rows] = batch[name][skip:]
+        self.n_invalid += int(np.count_nonzero(~self.valid[rows]))
+        self.size += n_tail
+        self.head = (self.head + n - n_tail) % self.capacity
+
+    def clear(self):
+        self.size = 0
+        self.head = 0
+        self.n_invalid = 0
+
+    def sample(self, n):
+        """Returns n random rows"""
+        return np.random.randint(0, self.size, n)
+
+    def get(self, rows):
+        """Returns a dict of column values at rows"""
+        return {name: getattr(self, name)[rows] for name, _ in self.columns}
+
+    def invalidate(self, rows):
+        rows = np.unique(rows)
+        rows = rows[self.valid[rows]]
+        self.valid[rows] = False
+        self.n_invalid += len(rows)
+
+    def compact(self):
+        """Drops invalid rows, keeping the others in the order they were appended"""
+        rows = self.get_ordered_rows()
+        rows = rows[self.valid[rows]]
+        size = len(rows)
+        for name, _ in self.columns:
+            column = getattr(self, name)
+            column[:size] = column[rows]
+        self.size = size
+        self.head = 0
+        self.n_invalid = 0
+
+    def get_ordered_rows(self):
+        return (self.head + np.arange(self.size)) % max(self.size, 1)
+
+    def get_period(self):
+        """Returns times of the oldest and the newest transitions"""
+        rows = self.get_ordered_rows()
+        return int(self.t[rows[0]]), int(self.t[rows[-1]])
+
+    def save(self, path):
+        """Writes valid transitions in the order they were appended to path"""
+        if not os.path.exists(path):
+            os.makedirs(path)
+        rows = self.get_ordered_rows()
+        rows = rows[self.valid[rows]]
+        for name, _ in self.columns:
+            np.save(os.path.join(path, name), getattr(self, name)[rows])
+        with open(os.path.join(path, META_FILE), 'w') as f:
+            json.dump({'size': len(rows)}, f)
+
+    @classmethod
+    def load(cls, path, capacity):
+        """Opens columns written by save as copy-on-write memory maps; they are read into memory
+        only when the memory grows"""
+        memory = cls(capacity, initial_capacity=0)
+        for name, _ in cls.columns:
+            column = np.load(os.path.join(path, name + '.npy'), mmap_mode='c')
+            setattr(memory, name, column[-capacity:])
+        memory.size = len(memory.t)
+        return memory
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, META_FILE))
+
+    def __grow(self):
+        capacity = min(max(len(self.t) * 2, 1), self.capacity)
+        for name, dtype in self.columns:
+            column = np.zeros(capacity, dtype=dtype)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
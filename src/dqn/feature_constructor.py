@@ -1,11 +1,12 @@
 import numpy as np
+from scipy import sparse
 from skimage.transform import downscale_local_mean, resize
 import os
 from common.time_utils import get_local_datetime
 from config.settings import MAP_WIDTH, MAP_HEIGHT, DATA_DIR, MIN_DISPATCH_CYCLE,\
     DESTINATION_PROFILE_SPATIAL_AGGREGATION, DESTINATION_PROFILE_TEMPORAL_AGGREGATION
 from .settings import MAX_MOVE, NUM_SUPPLY_DEMAND_MAPS, FLAGS
-from common import vehicle_status_codes, mesh
+from common import vehicle_status_codes, mesh, cache
 from .demand_loader import DemandLoader
 
 
@@ -20,26 +21,51 @@ class FeatureConstructor(object):
         self.reachable_map = self.load_reachable_map()
         self.state_space = [(x, y) for x in range(MAP_WIDTH) for y in range(MAP_HEIGHT) if self.reachable_map[x, y] == 1]
         self.DT = self.load_dt_map()
+        # filters depend only on the map files and the settings, so they are cached across processes
+        data_key = (cache.file_digest(os.path.join(DATA_DIR, 'tt_map.npy')),
+                    cache.file_digest(os.path.join(DATA_DIR, 'reachable_map.npy')), MAX_MOVE, MIN_DISPATCH_CYCLE)
         if FLAGS.average:
             self.D_out = self.D_in = np.ones((MAP_WIDTH, MAP_HEIGHT)) / (L ** 2)
         else:
-            self.D_out, self.D_in = self.build_diffusion_filter()
-
-        self.d_entropy = self.build_diffusion_entropy_map()
+            D = cache.load_or_compute("diffusion_filter", data_key, lambda: np.stack(self.build_diffusion_filter()))
+            self.D_out, self.D_in = D[0], D[1]
+        self.D_out_operator = self.build_diffusion_operator(self.D_out)
+        self.D_in_operator = self.build_diffusion_operator(self.D_in)
+
+        entropy_key = data_key + (FLAGS.average, FLAGS.n_diffusions)
+        self.d_entropy = cache.load_or_compute("diffusion_entropy", entropy_key,
+                                               lambda: np.stack(self.build_diffusion_entropy_map()), mmap_mode='r')
+        self.action_valid, self.action_ptr, self.action_offset, self.action_target = self.build_action_table()
+        self.action_list = [(int(o) // L - MAX_MOVE, int(o) % L - MAX_MOVE) for o in self.action_offset]
+        self.action_tt = self.DT.reshape(-1)[np.repeat(np.arange(MAP_WIDTH * MAP_HEIGHT), np.diff(self.action_ptr)) * L ** 2
+                                             + self.action_offset]
+        self.supply_demand_maps = None
         self.TT = None
         self.OD = None
 
 
-    def action_space_iter(self, x, y):
-        yield (0, 0)
-        for ax in range(-MAX_MOVE, MAX_MOVE + 1):
-            for ay in range(-MAX_MOVE, MAX_MOVE + 1):
-                if ax == 0 and ay == 0:
-                    continue
-                x_ = x + ax
-                y_ = y + ay
-                if self.is_reachable(x_, y_):
-                    yield (ax, ay)
+    def build_action_table(self):
+        """Returns valid[x, y, axi, ayi] of actions within a dispatch cycle to reachable cells, and the valid actions
+        of all cells in CSR layout: actions of cell c = x * MAP_HEIGHT + y are action_offset[action_ptr[c]:action_ptr[c + 1]],
+        indices of the flattened L x L window with the wait action first, and action_target are the flat moved-to cells"""
+        x = np.arange(MAP_WIDTH)[:, None, None, None]
+        y = np.arange(MAP_HEIGHT)[None, :, None, None]
+        axi = np.arange(L)[None, None, :, None]
+        ayi = np.arange(L)[None, None, None, :]
+        x_, y_ = x + axi - MAX_MOVE, y + ayi - MAX_MOVE
+        inside = (x_ >= 0) & (x_ < MAP_WIDTH) & (y_ >= 0) & (y_ < MAP_HEIGHT)
+        x_, y_ = np.clip(x_, 0, MAP_WIDTH - 1), np.clip(y_, 0, MAP_HEIGHT - 1)
+        valid = inside & (self.reachable_map[x_, y_] == 1)
+        valid[:, :, MAX_MOVE, MAX_MOVE] = True
+        valid &= self.DT <= 1
+
+        wait = MAX_MOVE * L + MAX_MOVE
+        order = np.array([wait] + [i for i in range(L ** 2) if i != wait])
+        cells, j = np.nonzero(valid.reshape(MAP_WIDTH * MAP_HEIGHT, L ** 2)[:, order])
+        offset = order[j]
+        ptr = np.searchsorted(cells, np.arange(MAP_WIDTH * MAP_HEIGHT + 1))
+        target = cells + (offset // L - MAX_MOVE) * MAP_HEIGHT + offset % L - MAX_MOVE
+        return valid, ptr, offset, target
 
     def load_reachable_map(self):
         return np.load(os.path.join(DATA_DIR, 'reachable_map.npy'))
@@ -49,22 +75,49 @@ class FeatureConstructor(object):
 
     def build_diffusion_filter(self):
         D_out = np.exp(-(self.DT) ** 2 + 1) / (L ** 2)
-        D_in = np.zeros((MAP_WIDTH, MAP_HEIGHT, L, L))
-        for x, y in self.state_space:
-            for ax, ay in self.action_space_iter(x, y):
-                axi, ayi = MAX_MOVE + ax, MAX_MOVE + ay
-                D_in[x, y, axi, ayi] = D_out[x + ax, y + ay, -axi-1, -ayi-1]
+        # D_in of a move from a reachable cell to a reachable cell is D_out of the reverse move
+        x = np.arange(MAP_WIDTH)[:, None, None, None]
+        y = np.arange(MAP_HEIGHT)[None, :, None, None]
+        axi = np.arange(L)[None, None, :, None]
+        ayi = np.arange(L)[None, None, None, :]
+        x_, y_ = x + axi - MAX_MOVE, y + ayi - MAX_MOVE
+        inside = (x_ >= 0) & (x_ < MAP_WIDTH) & (y_ >= 0) & (y_ < MAP_HEIGHT)
+        x_, y_ = np.clip(x_, 0, MAP_WIDTH - 1), np.clip(y_, 0, MAP_HEIGHT - 1)
+        reachable = self.reachable_map == 1
+        mask = inside & reachable[x, y] & reachable[x_, y_]
+        D_in = np.where(mask, D_out[x_, y_, L - 1 - axi, L - 1 - ayi], 0.0)
         return D_out, D_in
 
+    def build_diffusion_operator(self, d_filter):
+        """Sparse (cells x cells) matrix of one diffusion of flattened maps.
+        The row of each reachable cell holds its L x L filter at the cells in the window around it."""
+        if d_filter.ndim == 2:
+            d_filter = d_filter[:, :, None, None]
+        x, y = np.array(self.state_space).T
+        offsets = np.arange(L) - MAX_MOVE
+        src_x, src_y = np.broadcast_arrays(x[:, None, None] + offsets[:, None], y[:, None, None] + offsets)
+        values = np.broadcast_to(d_filter[x, y], src_x.shape)
+        valid = (src_x >= 0) & (src_x < MAP_WIDTH) & (src_y >= 0) & (src_y < MAP_HEIGHT) & (values != 0)
+        rows = np.broadcast_to((x * MAP_HEIGHT + y)[:, None, None], valid.shape)[valid]
+        cols = (src_x * MAP_HEIGHT + src_y)[valid]
+        n_cells = MAP_WIDTH * MAP_HEIGHT
+        return sparse.csr_matrix((values[valid], (rows, cols)), shape=(n_cells, n_cells))
+
 
     def build_diffusion_entropy_map(self):
-        entropy = np.zeros((MAP_WIDTH, MAP_HEIGHT))
-        for x, y in self.state_space:
-            entropy[x, y] = -(self.D_out[x, y] * np.log(self.D_out[x, y] + 1e-6)).sum()
+        D_out = self.D_out.reshape(MAP_WIDTH, MAP_HEIGHT, -1)
+        entropy = -(D_out * np.log(D_out + 1e-6)).sum(axis=2)
+        entropy = np.where(self.reachable_map == 1, entropy, 0.0)
         entropy /= np.log(L ** 2 + 1e-6)
-        diffused_entropy = [entropy] + self.diffusion_convolution(entropy, self.D_out, FLAGS.n_diffusions - 1)
+        diffused_entropy = [entropy] + self.diffusion_convolution([entropy], self.D_out_operator, FLAGS.n_diffusions - 1)
         return diffused_entropy
 
+    def reset(self):
+        # maps are recomputed at the first update since the time is 0
+        self.t = 0
+        self.fingerprint = (100000, 0)
+        self.supply_demand_maps = None
+
     def update_time(self, current_time):
         self.t = current_time
 
@@ -75,16 +128,14 @@ class FeatureConstructor(object):
         idle_map = self.construct_supply_map(idle[["lon", "lat"]].values)
         dropoff_map = self.construct_supply_map(occupied[["destination_lon", "destination_lat"]].values)
         self.supply_maps = [idle_map, dropoff_map]
-        self.diffused_supply = []
-        for s in self.supply_maps:
-            self.diffused_supply += self.diffusion_convolution(s, self.D_in, FLAGS.n_diffusions)
+        self.supply_demand_maps = None
+        self.diffused_supply = self.diffusion_convolution(self.supply_maps, self.D_in_operator, FLAGS.n_diffusions)
 
     def update_demand(self, t, demand_normalized_factor=0.1, tt_normalized_factor=1.0/1800, horizon=2):
         profile, diff = self.demand_loader.load(t, horizon=horizon)
         self.demand_maps = [d * demand_normalized_factor for d in profile] + [diff]
-        self.diffused_demand = []
-        for d in self.demand_maps:
-            self.diffused_demand += self.diffusion_convolution(d, self.D_out, FLAGS.n_diffusions)
+        self.supply_demand_maps = None
+        self.diffused_demand = self.diffusion_convolution(self.demand_maps, self.D_out_operator, FLAGS.n_diffusions)
 
         if FLAGS.trip_diffusion:
             if self.OD is None or t % (DESTINATION_PROFILE_TEMPORAL_AGGREGATION * 3600) == 0:
@@ -95,13 +146,16 @@ class FeatureConstructor(object):
             self.diffused_demand.append(self.trip_diffusion_convolution(d, self.OD))
             self.diffused_demand.append(self.TT)
 
-    def diffusion_convolution(self, img, d_filter, k):
-        M = img
+    def diffusion_convolution(self, imgs, operator, k):
+        """Returns maps diffused 1 to k times in the order of imgs.
+        All maps are diffused at once by a product of the sparse operator and the stacked maps."""
+        n = len(imgs)
+        M = np.stack(imgs, axis=-1).reshape(MAP_WIDTH * MAP_HEIGHT, n)
         diffused_maps = []
         for _ in range(k):
-            M = self.diffuse_map(M, d_filter)
-            diffused_maps.append(M)
-        return diffused_maps
+            M = operator.dot(M)
+            diffused_maps.append(M.T.reshape(n, MAP_WIDTH, MAP_HEIGHT).astype(np.float32))
+        return [diffused_maps[j][i] for i in range(n) for j in range(k)]
 
     def trip_diffusion_convolution(self, img, trip_filter):
         n = DESTINATION_PROFILE_SPATIAL_AGGREGATION
@@ -120,67 +174,80 @@ class FeatureConstructor(object):
     def update_fingerprint(self, fingerprint):
         self.fingerprint = fingerprint
 
-    def construct_current_features(self, x, y):
+    def construct_current_features(self, cells):
         M = self.get_supply_demand_maps()
         t = self.get_current_time()
         f = self.get_current_fingerprint()
-        l = (x, y)
-        s, actions = self.construct_features(t, f, l, M)
-        return s, actions
-
-    def construct_features(self, t, f, l, M):
-        state_feature = self.construct_state_feature(t, f, l, M)
-        actions, action_features = self.construct_action_features(t, l, M)
-        s = (state_feature, action_features)
-        return s, actions
-
-    def construct_state_feature(self, t, f, l, M):
-        x, y = l
-        state_feature = [m.mean() for m in M[:NUM_SUPPLY_DEMAND_MAPS]]
-        state_feature += [m[x, y] for m in M]
-        state_feature += [m[x, y] for m in self.d_entropy]
-        state_feature += self.construct_time_features(t) + self.construct_fingerprint_features(f)
-        return state_feature
-
-    def construct_action_features(self, t, l, M):
-        actions = []
-        action_features = []
-
-        for ax, ay in self.action_space_iter(*l):
-            a = (ax, ay)
-            feature = self.construct_action_feature(t, l, M, a)
-            if feature is not None:
-                actions.append(a)
-                action_features.append(feature)
-
-        return actions, action_features
-
-    def is_reachable(self, x, y):
-        return 0 <= x and x < MAP_WIDTH and 0 <= y and y < MAP_HEIGHT and self.reachable_map[x, y] == 1
-
-    def construct_action_feature(self, t, l, M, a):
+        return self.construct_features(t, f, cells, M)
+
+    def construct_features(self, t, f, cells, M):
+        """Returns features of all valid actions at cells stacked in the order of cells, and the actions of each cell"""
+        c = np.array([x * MAP_HEIGHT + y for x, y in cells], dtype=np.int64)
+        start, end = self.action_ptr[c], self.action_ptr[c + 1]
+        counts = end - start
+        index = np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        sa = self.construct_state_action_features(t, f, c, counts, self.action_target[index], self.action_tt[index], M)
+        actions = [self.action_list[s:e] for s, e in zip(start.tolist(), end.tolist())]
+        return sa, actions
+
+    def is_valid_action(self, l, a):
+        """Whether action a is valid at l; coordinates may be arrays"""
         x, y = l
         ax, ay = a
-        x_ = x + ax
-        y_ = y + ay
-        tt = self.get_triptime(x, y, ax, ay)
-        if tt <= 1:
-            action_feature = [m[x_, y_] for m in M]
-            action_feature += [m[x_, y_] for m in self.d_entropy]
-            action_feature += [tt]
-            # action_feature += self.construct_location_features((x_, y_)) + [tt]
-            return action_feature
-
-        return None
+        return self.action_valid[x, y, np.add(ax, MAX_MOVE), np.add(ay, MAX_MOVE)]
 
+    def count_actions(self, l):
+        """Number of valid actions at l; coordinates may be arrays"""
+        x, y = l
+        c = np.multiply(x, MAP_HEIGHT, dtype=np.int64) + y
+        return self.action_ptr[c + 1] - self.action_ptr[c]
+
+    def construct_action_taken_features(self, t, f, ls, actions, M):
+        """Returns features of each of valid actions taken at each of locations ls"""
+        x, y = np.array(ls, dtype=np.int64).reshape(-1, 2).T
+        ax, ay = np.array(actions, dtype=np.int64).reshape(-1, 2).T
+        cells = x * MAP_HEIGHT + y
+        targets = cells + ax * MAP_HEIGHT + ay
+        triptimes = self.DT[x, y, ax + MAX_MOVE, ay + MAX_MOVE]
+        return self.construct_state_action_features(t, f, cells, np.ones_like(cells), targets, triptimes, M)
+
+    def construct_state_action_features(self, t, f, cells, counts, targets, triptimes, M):
+        """Rows of features of state at each of flat cells repeated counts times followed by features of actions
+        moving to flat targets in triptimes. A state feature is the means of supply demand maps, all maps and
+        entropy maps at the cell, time and fingerprint; an action feature is all maps and entropy maps at the target
+        and the trip time."""
+        M = np.asarray(M)
+        flat_maps = M.reshape(len(M), -1)
+        flat_entropy = self.d_entropy.reshape(len(self.d_entropy), -1)
+        n_maps = len(flat_maps) + len(flat_entropy)
+        global_features = [m.mean(dtype=np.float32) for m in M[:NUM_SUPPLY_DEMAND_MAPS]]
+        time_features = self.construct_time_features(t) + self.construct_fingerprint_features(f)
+
+        sa = np.empty((len(targets), NUM_SUPPLY_DEMAND_MAPS + n_maps * 2 + len(time_features) + 1), dtype=np.float32)
+        i = NUM_SUPPLY_DEMAND_MAPS
+        sa[:, :i] = global_features
+        sa[:, i : i + n_maps] = np.repeat(self.gather_maps(flat_maps, flat_entropy, cells), counts, axis=0)
+        i += n_maps
+        sa[:, i : i + len(time_features)] = time_features
+        i += len(time_features)
+        sa[:, i : i + n_maps] = self.gather_maps(flat_maps, flat_entropy, targets)
+        sa[:, -1] = triptimes
+        return sa
+
+    def gather_maps(self, flat_maps, flat_entropy, cells):
+        """Values of all maps and entropy maps at flat cells, one row per cell"""
+        return np.concatenate([flat_maps[:, cells], flat_entropy[:, cells]]).T
 
     def get_triptime(self, x, y, ax, ay):
         return self.DT[x, y, ax + MAX_MOVE, ay + MAX_MOVE]
 
     def get_supply_demand_maps(self):
-        supply_demand_maps = self.supply_maps + self.demand_maps
-        diffused_maps = self.diffused_supply + self.diffused_demand
-        return supply_demand_maps + diffused_maps
+        """(n_maps, W, H) array of supply demand maps and their diffusions, stacked once per update"""
+        if self.supply_demand_maps is None:
+            supply_demand_maps = self.supply_maps + self.demand_maps
+            diffused_maps = self.diffused_supply + self.diffused_demand
+            self.supply_demand_maps = np.array(supply_demand_maps + diffused_maps, dtype=np.float32)
+        return self.supply_demand_maps
 
     def construct_initial_map(self, w=MAP_WIDTH, h=MAP_HEIGHT):
         return np.zeros((w, h), dtype=np.float32)
@@ -0,0 +1,54 @@
+"""Process training the dispatch network apart from the simulation and the queues connecting it to the actor.
+The actor sends (kind, data) messages to the learner, and the learner publishes states of its network."""
+import queue
+import multiprocessing as mp
+
+EXPERIENCE = 'experience'
+SUPPLY_DEMAND = 'supply_demand'
+DUMP = 'dump'
+STOP = 'stop'
+
+
+class LearnerProcess(object):
+    """Handle of a learner process held by the actor, which runs target(message_queue, state_queue, *args).
+    The process is spawned rather than forked since a TensorFlow session can not be shared with a child."""
+
+    def __init__(self, target, *args):
+        context = mp.get_context('spawn')
+        self.message_queue = context.Queue()
+        self.state_queue = context.Queue()
+        self.process = context.Process(target=target, args=(self.message_queue, self.state_queue) + args, daemon=True)
+        self.process.start()
+
+    def send_experience(self, batch):
+        self.message_queue.put((EXPERIENCE, batch))
+
+    def send_supply_demand(self, t, maps, fingerprint):
+        self.message_queue.put((SUPPLY_DEMAND, (t, maps, fingerprint)))
+
+    def dump_experience_memory(self):
+        self.message_queue.put((DUMP, None))
+
+    def receive_state(self, block=False):
+        """Returns the latest state published by the learner, or None if nothing has been published since the last call.
+        With block, waits until the learner publishes."""
+        state = None
+        while block and state is None:
+            try:
+                state = self.state_queue.get(timeout=1)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError("learner process exited with code {}".format(self.process.exitcode))
+        while True:
+            try:
+                state = self.state_queue.get_nowait()
+            except queue.Empty:
+                return state
+
+    def close(self):
+        """Waits for the learner to handle all sent messages and exit.
+        States published meanwhile are discarded; the learner can not exit while its queue holds unread states."""
+        self.message_queue.put((STOP, None))
+        while self.process.is_alive():
+            self.receive_state()
+            self.process.join(timeout=0.1)
@@ -10,6 +10,8 @@ from .settings import FLAGS
 class DeepQNetwork(object):
     def __init__(self, network_path=None):
         self.sa_input, self.q_values, self.model = self.build_q_network()
+        self.weight_placeholders = [tf.placeholder(w.dtype.base_dtype, w.shape) for w in self.model.trainable_weights]
+        self.assign_weights = [w.assign(p) for w, p in zip(self.model.trainable_weights, self.weight_placeholders)]
 
         if not os.path.exists(FLAGS.save_network_dir):
             os.makedirs(FLAGS.save_network_dir)
@@ -40,11 +42,16 @@ class DeepQNetwork(object):
         #     print('Loading failed')
 
 
-    def compute_q_values(self, s):
-        s_feature, a_features = s
+    def get_weights(self):
+        return self.sess.run(self.model.trainable_weights)
+
+    def set_weights(self, weights):
+        self.sess.run(self.assign_weights, feed_dict=dict(zip(self.weight_placeholders, weights)))
+
+    def compute_q_values(self, sa):
         q = self.q_values.eval(
             feed_dict={
-                self.sa_input: np.array([s_feature + a_feature for a_feature in a_features], dtype=np.float32)
+                self.sa_input: sa
             })[:, 0]
         return q
 
@@ -57,7 +64,34 @@ class DeepQNetwork(object):
             return amax
 
 
-class FittingDeepQNetwork(DeepQNetwork):
+class ExploringDeepQNetwork(DeepQNetwork):
+    """Network acting e-greedily with the exploration rate of its training step"""
+
+    def __init__(self, network_path=None):
+        super().__init__(network_path)
+        self.n_steps = 0
+        self.epsilon = settings.INITIAL_EPSILON
+
+    def get_action(self, q_values, amax):
+        # e-greedy exploration
+        if self.epsilon > np.random.random():
+            return np.random.randint(len(q_values))
+        else:
+            return super().get_action(q_values, amax)
+
+    def get_fingerprint(self):
+        return self.n_steps, self.epsilon
+
+    def get_state(self):
+        """Training step, exploration rate and weights, as published by a learner"""
+        return self.n_steps, self.epsilon, self.get_weights()
+
+    def set_state(self, state):
+        self.n_steps, self.epsilon, weights = state
+        self.set_weights(weights)
+
+
+class FittingDeepQNetwork(ExploringDeepQNetwork):
 
     def __init__(self, network_path=None):
         super().__init__(network_path)
@@ -80,8 +114,6 @@ class FittingDeepQNetwork(DeepQNetwork):
         # Initialize target network
         self.sess.run(self.update_target_network)
 
-        self.n_steps = 0
-        self.epsilon = settings.INITIAL_EPSILON
         self.epsilon_step = (settings.FINAL_EPSILON - settings.INITIAL_EPSILON) / settings.EXPLORATION_STEPS
 
 
@@ -91,30 +123,27 @@ class FittingDeepQNetwork(DeepQNetwork):
         self.summary_writer = tf.summary.FileWriter(FLAGS.save_summary_dir, self.sess.graph)
 
 
-    def get_action(self, q_values, amax):
-        # e-greedy exploration
-        if self.epsilon > np.random.random():
-            return np.random.randint(len(q_values))
-        else:
-            return super().get_action(q_values, amax)
-
-    def get_fingerprint(self):
-        return self.n_steps, self.epsilon
-
-    def compute_target_q_values(self, s):
-        s_feature, a_features = s
+    def compute_target_q_values(self, sa):
         q = self.target_q_values.eval(
             feed_dict={
-                self.target_sub_input: np.array([s_feature + a_feature for a_feature in a_features], dtype=np.float32)
+                self.target_sub_input: sa
             })[:, 0]
         return q
 
-    def compute_target_value(self, s):
-        Q = self.compute_target_q_values(s)
-        amax = np.argmax(self.compute_q_values(s))
+    def compute_target_values(self, sa, counts):
+        """Target values of states whose action features are stacked in sa, counts rows per state.
+        Actions are chosen by the online network and evaluated by the target network."""
+        Q = self.compute_target_q_values(sa)
+        Q_online = self.compute_q_values(sa)
+        counts = np.asarray(counts)
+        starts = np.cumsum(counts) - counts
+        # the first action of each state whose online value is the max
+        is_max = Q_online == np.repeat(np.maximum.reduceat(Q_online, starts), counts)
+        amax = np.minimum.reduceat(np.where(is_max, np.arange(len(sa)), len(sa)), starts)
         V = Q[amax]
         if FLAGS.alpha > 0:
-            V += FLAGS.alpha * np.log(np.exp((Q - Q.max()) / FLAGS.alpha).sum())
+            Q_max = np.repeat(np.maximum.reduceat(Q, starts), counts)
+            V += FLAGS.alpha * np.log(np.add.reduceat(np.exp((Q - Q_max) / FLAGS.alpha), starts))
         return V
 
 
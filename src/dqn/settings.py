@@ -18,17 +18,21 @@ flags.DEFINE_string('load_network', '', "load saved dqn network.")
 flags.DEFINE_string('load_memory', '', "load saved replay memory.")
 
 flags.DEFINE_boolean('train', False, "run training dqn network.")
+flags.DEFINE_boolean('async_learner', False, "whether to train dqn network in a separate learner process")
 flags.DEFINE_boolean('verbose', False, "print log verbosely.")
 flags.DEFINE_integer('pretrain', 0, "run N pretraining steps using pickled experience memory.")
 flags.DEFINE_integer('vehicles', 8000, "number of vehicles")
 flags.DEFINE_integer('start_time', 1464753600 + 3600 * 5, "simulation start datetime (unixtime)")
 flags.DEFINE_integer('start_offset', 0, "simulation start datetime offset (days)")
 flags.DEFINE_integer('days', 7, "simulation days")
+flags.DEFINE_integer('workers', 0, "number of processes simulating days in parallel when not training")
 flags.DEFINE_integer('n_diffusions', 3, "number of diffusion convolution")
 flags.DEFINE_integer('batch_size', 128, "number of samples in a batch for SGD")
 flags.DEFINE_string('tag', 'test', "tag used to identify logs")
 flags.DEFINE_boolean('log_vehicle', False, "whether to log vehicle states")
 flags.DEFINE_boolean('use_osrm', False, "whether to use OSRM")
+flags.DEFINE_boolean('async_routing', False, "whether to overlap OSRM routing of dispatch commands with the next step")
+flags.DEFINE_string('matching', 'greedy', "matching policy: greedy or optimal")
 flags.DEFINE_boolean('average', False, "whether to use diffusion filter or average filter")
 flags.DEFINE_boolean('trip_diffusion', False, "whether to use trip diffusion")
 flags.DEFINE_boolean('f', False, "")
@@ -58,6 +62,7 @@ NUM_SUPPLY_DEMAND_HISTORY = 7 * 24 * 3600 / GLOBAL_STATE_UPDATE_CYCLE + 1 # = 1
 MAX_MEMORY_SIZE = 10000000  # Number of replay memory the agent uses for training
 SAVE_INTERVAL = 1000  # The frequency with which the network is saved
 TARGET_UPDATE_INTERVAL = 50  # The frequency with which the target network is updated
+PUBLISH_INTERVAL = 10  # The frequency with which an asynchronous learner publishes the network to the actor
 LEARNING_RATE = 0.00025  # Learning rate used by RMSProp
 MOMENTUM = 0.95  # Momentum used by RMSProp
 MIN_GRAD = 0.01  # Constant added to the squared gradient in the denominator of the RMSProp update
@@ -0,0 +1,153 @@
+"""History of supply demand maps replayed in training.
+Snapshots are kept in a ring indexed by time, and their maps in a shared pool saved as .npy files
+that are opened with np.memmap on load."""
+import os
+import json
+import hashlib
+import numpy as np
+
+META_FILE = "meta.json"
+
+
+class SupplyDemandHistory(object):
+    """Supply demand snapshots taken every cycle seconds, holding the last capacity cycles.
+    A snapshot at time t lives in slot (t // cycle) % capacity and refers to its maps by rows of the pool,
+    so maps repeated across snapshots are stored once."""
+
+    def __init__(self, capacity, cycle, dtype=np.float16, initial_pool_size=256):
+        self.capacity = int(capacity)
+        self.cycle = cycle
+        self.dtype = np.dtype(dtype)
+        self.initial_pool_size = initial_pool_size
+        self.times = np.full(self.capacity, -1, dtype=np.int64)
+        self.fingerprints = np.zeros((self.capacity, 2))
+        self.map_rows = None        # (capacity, n_maps) rows of the pool
+        self.pool = None            # (pool size, W, H) maps
+        self.refcounts = np.zeros(0, dtype=np.int64)
+        self.free_rows = []
+        self.n_rows = 0             # rows of the pool used so far
+        self.size = 0
+        # digests of maps in the pool, built on the first put after load
+        self.row_digests = None
+        self.digest_rows = None
+
+    def __len__(self):
+        return self.size
+
+    def get_slot(self, t):
+        return (t // self.cycle) % self.capacity
+
+    def put(self, t, maps, fingerprint):
+        """Stores (n_maps, W, H) maps of time t, replacing the snapshot of t - capacity * cycle"""
+        t = t - t % self.cycle
+        maps = np.asarray(maps).astype(self.dtype)
+        if self.pool is None:
+            self.pool = np.zeros((self.initial_pool_size,) + maps.shape[1:], dtype=self.dtype)
+            self.refcounts = np.zeros(self.initial_pool_size, dtype=np.int64)
+            self.map_rows = np.full((self.capacity, len(maps)), -1, dtype=np.int32)
+        if self.row_digests is None:
+            self.__build_digests()
+
+        slot = self.get_slot(t)
+        if self.times[slot] >= 0:
+            self.__release(slot)
+        self.map_rows[slot] = [self.__intern(m) for m in maps]
+        self.times[slot] = t
+        self.fingerprints[slot] = fingerprint
+        self.size += 1
+
+    def get(self, t):
+        """Returns maps and fingerprint of the snapshot of t, or (None, None) if it is not held.
+        Maps are in the stored dtype; features gathered from them are converted to float32."""
+        t = t - t % self.cycle
+        slot = self.get_slot(t)
+        if self.times[slot] != t:
+            return None, None
+        maps = self.pool[self.map_rows[slot]]
+        n_steps, epsilon = self.fingerprints[slot]
+        return maps, (int(n_steps), float(epsilon))
+
+    def contains(self, ts):
+        """Whether snapshots of times ts are held; ts may be an array"""
+        ts = np.asarray(ts, dtype=np.int64)
+        ts = ts - ts % self.cycle
+        return self.times[self.get_slot(ts)] == ts
+
+    def save(self, path):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, "pool"), self.pool[:self.n_rows] if self.pool is not None else np.zeros(0))
+        np.save(os.path.join(path, "map_rows"), self.map_rows if self.map_rows is not None else np.zeros((0, 0)))
+        np.save(os.path.join(path, "times"), self.times)
+        np.save(os.path.join(path, "fingerprints"), self.fingerprints)
+        with open(os.path.join(path, META_FILE), 'w') as f:
+            json.dump({'capacity': self.capacity, 'cycle': self.cycle, 'dtype': self.dtype.name}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Opens the pool written by save as a copy-on-write memory map"""
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        history = cls(meta['capacity'], meta['cycle'], meta['dtype'])
+        history.times = np.load(os.path.join(path, "times.npy"))
+        history.fingerprints = np.load(os.path.join(path, "fingerprints.npy"))
+        history.size = int(np.count_nonzero(history.times >= 0))
+        if history.size > 0:
+            history.pool = np.load(os.path.join(path, "pool.npy"), mmap_mode='c')
+            history.map_rows = np.load(os.path.join(path, "map_rows.npy"))
+            history.n_rows = len(history.pool)
+            rows = history.map_rows[history.times >= 0].ravel()
+            history.refcounts = np.bincount(rows, minlength=history.n_rows).astype(np.int64)
+            history.free_rows = np.nonzero(history.refcounts == 0)[0].tolist()
+        return history
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, META_FILE))
+
+    def __intern(self, m):
+        digest = hashlib.sha1(m.tobytes()).digest()
+        row = self.digest_rows.get(digest)
+        if row is None:
+            row = self.__allocate()
+            self.pool[row] = m
+            self.digest_rows[digest] = row
+            self.row_digests[row] = digest
+        self.refcounts[row] += 1
+        return row
+
+    def __release(self, slot):
+        for row in self.map_rows[slot].tolist():
+            self.refcounts[row] -= 1
+            if self.refcounts[row] == 0:
+                del self.digest_rows[self.row_digests.pop(row)]
+                self.free_rows.append(row)
+        self.times[slot] = -1
+        self.size -= 1
+
+    def __allocate(self):
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self.n_rows == len(self.pool):
+            self.__grow()
+        row = self.n_rows
+        self.n_rows += 1
+        return row
+
+    def __grow(self):
+        size = len(self.pool) * 2
+        pool = np.zeros((size,) + self.pool.shape[1:], dtype=self.dtype)
+        pool[:self.n_rows] = self.pool[:self.n_rows]
+        self.pool = pool
+        refcounts = np.zeros(size, dtype=np.int64)
+        refcounts[:self.n_rows] = self.refcounts[:self.n_rows]
+        self.refcounts = refcounts
+
+    def __build_digests(self):
+        self.row_digests = {}
+        self.digest_rows = {}
+        for row in range(self.n_rows):
+            if self.refcounts[row] > 0:
+                digest = hashlib.sha1(self.pool[row].tobytes()).digest()
+                self.row_digests[row] = digest
+                self.digest_rows[digest] = row
@@ -0,0 +1,114 @@
+"""Evaluation of a dispatch policy over days simulated in parallel processes.
+Each day runs in its own Experiment and log directory; read-only assets are memory-mapped from files
+cached before the workers start, and the logs of all days are merged into one directory at the end."""
+import os
+import multiprocessing as mp
+import numpy as np
+from experiment import Experiment
+from agent.matching_policy import GreedyMatchingPolicy, OptimalMatchingPolicy
+from dqn.dqn_policy import DQNDispatchPolicy
+from dqn.demand_loader import DemandLoader
+from dqn.settings import FLAGS
+from config.settings import TIMESTEP, MAP_WIDTH, MAP_HEIGHT
+from simulator.services.routing_service import RoutingEngine
+from common import mesh
+from logger import sim_logger
+from logger.merge import merge_logs
+
+# policy with its network and features built once per worker process and reset for each simulation
+worker_dispatch_policy = None
+
+
+def sample_initial_locations(t):
+    locations = [mesh.convert_xy_to_lonlat(x, y)[::-1] for x in range(MAP_WIDTH) for y in range(MAP_HEIGHT)]
+    p = DemandLoader.load_demand_profile(t)
+    p = p.flatten() / p.sum()
+    vehicle_locations = [locations[i] for i in np.random.choice(len(locations), size=FLAGS.vehicles, p=p)]
+    return vehicle_locations
+
+
+def create_matching_policy(**params):
+    """Matching policy selected by the flag, with attributes such as reject_distance overridden by params"""
+    if FLAGS.matching == 'optimal':
+        matching_policy = OptimalMatchingPolicy()
+    else:
+        matching_policy = GreedyMatchingPolicy()
+    for name, value in params.items():
+        if not hasattr(matching_policy, name):
+            raise ValueError("{} has no parameter {}".format(type(matching_policy).__name__, name))
+        setattr(matching_policy, name, value)
+    return matching_policy
+
+
+def simulate_days(experiment, n_days, verbose=False):
+    """Populates vehicles at the beginning of each day, then runs an hour with new vehicles
+    so that those of the last day finish their shifts"""
+    n_steps = int(3600 * 24 / TIMESTEP)
+    buffer_steps = int(3600 / TIMESTEP)
+
+    for _ in range(n_days):
+        vehicle_locations = sample_initial_locations(experiment.simulator.get_current_time() + 3600 * 3)
+        experiment.populate_vehicles(vehicle_locations)
+        for i in range(n_steps):
+            experiment.step(verbose=verbose)
+
+    vehicle_locations = sample_initial_locations(experiment.simulator.get_current_time() + 3600 * 3)
+    experiment.populate_vehicles(vehicle_locations)
+    for i in range(buffer_steps):
+        experiment.step(verbose=verbose)
+
+
+def init_worker(load_network):
+    global worker_dispatch_policy
+    RoutingEngine.create_engine()
+    worker_dispatch_policy = DQNDispatchPolicy()
+    if load_network:
+        worker_dispatch_policy.build_q_network(load_network)
+
+
+def get_worker_dispatch_policy():
+    worker_dispatch_policy.reset()
+    return worker_dispatch_policy
+
+
+def get_first_vehicle_id(day):
+    # each day populates vehicles twice, for the day and for the hour after it, so ids of days never overlap
+    return 1 + day * FLAGS.vehicles * 2
+
+
+def evaluate_day(task):
+    """Simulates one day starting at start_time with the reset policy of the worker, logging into log_dir"""
+    day, start_time, log_dir = task
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    sim_logger.set_log_dir(log_dir)
+
+    experiment = Experiment(start_time, TIMESTEP, get_worker_dispatch_policy(), create_matching_policy())
+    experiment.last_vehicle_id = get_first_vehicle_id(day)
+    try:
+        simulate_days(experiment, 1, FLAGS.verbose)
+    finally:
+        experiment.close()
+    return log_dir
+
+
+def evaluate_days(start_time, n_days, n_workers, load_network, log_dir):
+    """Simulates n_days days from start_time in n_workers processes and merges their logs into log_dir/sim"""
+    # computes cached filters and distances once so that workers only map them
+    DQNDispatchPolicy()
+    RoutingEngine.create_engine()
+
+    tasks = [(day, start_time + 3600 * 24 * day, os.path.join(log_dir, "days", str(day))) for day in range(n_days)]
+    # workers are spawned so that each one creates its own TensorFlow session
+    context = mp.get_context('spawn')
+    pool = context.Pool(min(n_workers, n_days), initializer=init_worker, initargs=(load_network,))
+    try:
+        for day_log_dir in pool.imap_unordered(evaluate_day, tasks):
+            print("Finished: {}".format(day_log_dir), flush=True)
+    finally:
+        pool.close()
+        pool.join()
+
+    # the hour after each day is simulated again by the next day, which logs its requests
+    periods = [(day_start + 3600 * 24, get_first_vehicle_id(day) + FLAGS.vehicles) for day, day_start, _ in tasks[:-1]]
+    merge_logs([day_log_dir for _, _, day_log_dir in tasks], os.path.join(log_dir, "sim"), periods + [None])
@@ -17,6 +17,9 @@ class Experiment(object):
         # self.simulator.log_score()
         self.simulator.reset(start_time, timestep)
 
+    def close(self):
+        self.simulator.close()
+
     def populate_vehicles(self, vehicle_locations):
         n_vehicles = len(vehicle_locations)
         vehicle_ids = range(self.last_vehicle_id, self.last_vehicle_id + n_vehicles)
@@ -45,19 +48,22 @@ class Experiment(object):
         self.enter_market()
         self.simulator.step()
         vehicles = self.simulator.get_vehicles_state()
+        vehicle_index = self.simulator.get_vehicle_index()
         requests = self.simulator.get_new_requests()
         current_time = self.simulator.get_current_time()
-        m_commands, d_commands = self.agent.get_commands(current_time, vehicles, requests)
+        m_commands, d_commands = self.agent.get_commands(current_time, vehicles, requests, vehicle_index)
         self.simulator.match_vehicles(m_commands)
         self.simulator.dispatch_vehicles(d_commands)
 
-        net_v = vehicles[vehicles.status != vehicle_status_codes.OFF_DUTY]
+        status = vehicles.status.values
+        n_net_vehicles = np.count_nonzero(status != vehicle_status_codes.OFF_DUTY)
+        n_occupied_vehicles = np.count_nonzero(status == vehicle_status_codes.OCCUPIED)
         if len(m_commands) > 0:
             average_wt = np.mean([command['duration'] for command in m_commands]).astype(int)
         else:
             average_wt = 0
         summary = "{:d}, {:d}, {:d}, {:d}, {:d}, {:d}, {:d}".format(
-            current_time, len(net_v), len(net_v[net_v.status == vehicle_status_codes.OCCUPIED]),
+            current_time, n_net_vehicles, n_occupied_vehicles,
             len(requests), len(m_commands), len(d_commands), average_wt
         )
         sim_logger.log_summary(summary)
@@ -6,6 +6,8 @@ import yaml
 config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logging.yaml')
 
 class SimulationLogger(object):
+    # directory which overrides those of the log files in the config
+    log_dir = None
 
     # def __init__(self, path, level=logging.INFO):
         # self.setup_logging(path, level)
@@ -18,6 +20,10 @@ class SimulationLogger(object):
     def setup_logging(self, env, path=config_path, level=logging.INFO):
         with open(path, 'rt') as f:
             config = yaml.safe_load(f.read())
+        if self.log_dir is not None:
+            for handler in config['handlers'].values():
+                if 'filename' in handler:
+                    handler['filename'] = os.path.join(self.log_dir, os.path.basename(handler['filename']))
         logging.config.dictConfig(config)
         self.vehicle_logger = getLogger('vehicle')
         self.customer_logger = getLogger('customer')
@@ -25,6 +31,9 @@ class SimulationLogger(object):
         self.score_logger = getLogger('score')
         self.env = env
 
+    def set_log_dir(self, log_dir):
+        self.log_dir = log_dir
+
     def get_current_time(self):
         if self.env:
             return self.env.get_current_time()
@@ -38,6 +47,13 @@ class SimulationLogger(object):
         t = self.get_current_time()
         self.customer_logger.info('{},{}'.format(str(t), msg))
 
+    def log_customer_events(self, msgs):
+        """Writes events of many customers as one multi-line record"""
+        if len(msgs) == 0:
+            return
+        t = str(self.get_current_time())
+        self.customer_logger.info('\n'.join('{},{}'.format(t, msg) for msg in msgs))
+
     def log_summary(self, summary):
         self.summary_logger.info(summary)
 
@@ -0,0 +1,49 @@
+"""Merging of logs written by simulations of consecutive periods into one directory.
+A simulation of a period runs past its end so that its vehicles finish their shifts; records it writes after
+the end are kept only if they belong to its own vehicles, since the simulation of the next period logs the rest."""
+import os
+import shutil
+
+# logs of records starting with time, and of vehicle events whose second field is the vehicle id
+REQUEST_LOG_FILES = ["customer.log", "summary.log"]
+VEHICLE_LOG_FILES = ["vehicle.log", "score.log"]
+LOG_FILES = REQUEST_LOG_FILES + VEHICLE_LOG_FILES + ["errors.log"]
+
+
+def get_log_paths(log_dir, name):
+    """Paths of the log and its rotated files, oldest first"""
+    path = os.path.join(log_dir, name)
+    n_rotated = 0
+    while os.path.exists("{}.{}".format(path, n_rotated + 1)):
+        n_rotated += 1
+    paths = ["{}.{}".format(path, i) for i in range(n_rotated, 0, -1)]
+    if os.path.exists(path):
+        paths.append(path)
+    return paths
+
+
+def is_kept(name, line, end_time, vehicle_id_end):
+    if name not in REQUEST_LOG_FILES + VEHICLE_LOG_FILES:
+        return True
+    fields = line.split(b',', 2)
+    if len(fields) < 2 or int(fields[0]) < end_time:
+        return True
+    return name in VEHICLE_LOG_FILES and int(fields[1]) < vehicle_id_end
+
+
+def merge_logs(log_dirs, output_dir, periods=None):
+    """Concatenates the logs of each directory in order into output_dir.
+    periods gives (end time, end of vehicle ids) of each directory, or None to keep all of its records."""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    if periods is None:
+        periods = [None] * len(log_dirs)
+    for name in LOG_FILES:
+        with open(os.path.join(output_dir, name), 'wb') as output:
+            for log_dir, period in zip(log_dirs, periods):
+                for path in get_log_paths(log_dir, name):
+                    with open(path, 'rb') as f:
+                        if period is None:
+                            shutil.copyfileobj(f, output)
+                        else:
+                            output.writelines(line for line in f if is_kept(name, line, *period))
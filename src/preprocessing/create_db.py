@@ -5,6 +5,8 @@ import os
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
 from db import engine, Session
+from config.settings import REQUEST_BACKLOG_DIR, TIMESTEP
+from simulator.services.request_backlog import write_request_backlog
 
 
 def create_request_backlog(input_file_path, table_name):
@@ -28,8 +30,25 @@ def create_request_backlog(input_file_path, table_name):
     print("complete db insert")
 
 
+def create_request_backlog_arrays(source, output_dir):
+    """Converts ride requests from a csv file or a table in the database to memory-mappable arrays"""
+    if source.endswith(".csv"):
+        df = pd.read_csv(source, index_col='id')
+    else:
+        df = pd.read_sql("SELECT * FROM {}".format(source), engine, index_col='id')
+    print("load {} rows".format(len(df)))
+    write_request_backlog(df, output_dir, bucket=TIMESTEP)
+    print("complete writing arrays to {}".format(output_dir))
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument("input_file", help = "csv data path of ride requests backlog")
+    parser.add_argument("input_file", nargs='?', help = "csv data path of ride requests backlog")
+    parser.add_argument("--output_dir", default=REQUEST_BACKLOG_DIR, help = "directory of memory-mapped backlog")
+    parser.add_argument("--from_db", action='store_true', help = "convert request_backlog table to arrays only")
     args = parser.parse_args()
-    create_request_backlog(args.input_file, "request_backlog")
+    if args.from_db:
+        create_request_backlog_arrays("request_backlog", args.output_dir)
+    else:
+        create_request_backlog(args.input_file, "request_backlog")
+        create_request_backlog_arrays(args.input_file, args.output_dir)
@@ -8,6 +8,7 @@ from simulator.services.osrm_engine import OSRMEngine
 from config.settings import MAP_WIDTH, MAP_HEIGHT
 from common.mesh import convert_xy_to_lonlat
 from common.geoutils import great_circle_distance
+from simulator.services.route_table import write_route_table
 from dqn.settings import MAX_MOVE
 
 state_space = [(x, y) for x in range(MAP_WIDTH) for y in range(MAP_HEIGHT)]
@@ -74,7 +75,16 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("data_dir", help = "data directory")
     # parser.add_argument("--route", action='store_true', help="whether compute route or not")
+    parser.add_argument("--from_pickle", action='store_true', help="only convert routes.pkl to route table")
     args = parser.parse_args()
+    a_size = MAX_MOVE * 2 + 1
+    table_shape = (MAP_WIDTH, MAP_HEIGHT, a_size, a_size)
+
+    if args.from_pickle:
+        print("create route table")
+        routes = pickle.load(open("{}/routes.pkl".format(args.data_dir), "rb"))
+        write_route_table(routes, table_shape, MAX_MOVE, args.data_dir)
+        sys.exit(0)
 
     engine = OSRMEngine()
 
@@ -90,3 +100,6 @@ if __name__ == '__main__':
     # if args.route:
     routes = create_routes(engine, reachable_map)
     pickle.dump(routes, open("{}/routes.pkl".format(args.data_dir), "wb"))
+
+    print("create route table")
+    write_route_table(routes, table_shape, MAX_MOVE, args.data_dir)
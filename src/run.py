@@ -1,15 +1,13 @@
 # import sys
 import os
 # sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-import numpy as np
 from experiment import Experiment
-from agent.matching_policy import GreedyMatchingPolicy
+from evaluation import create_matching_policy, simulate_days, evaluate_days
 from dqn.dqn_policy import DQNDispatchPolicy, DQNDispatchPolicyLearner
-from dqn.demand_loader import DemandLoader
+from dqn.actor_learner import DQNDispatchPolicyActor
 from dqn.settings import NUM_SUPPLY_DEMAND_HISTORY, FLAGS
-from config.settings import TIMESTEP, DEFAULT_LOG_DIR, MAP_WIDTH, MAP_HEIGHT
+from config.settings import TIMESTEP, DEFAULT_LOG_DIR
 from common.time_utils import get_local_datetime
-from common import mesh
 
 
 def setup_base_log_dir(base_log_dir):
@@ -31,33 +29,26 @@ def setup_base_log_dir(base_log_dir):
     os.symlink(base_log_dir, DEFAULT_LOG_DIR)
 
 
-def sample_initial_locations(t):
-    locations = [mesh.convert_xy_to_lonlat(x, y)[::-1] for x in range(MAP_WIDTH) for y in range(MAP_HEIGHT)]
-    p = DemandLoader.load_demand_profile(t)
-    p = p.flatten() / p.sum()
-    vehicle_locations = [locations[i] for i in np.random.choice(len(locations), size=FLAGS.vehicles, p=p)]
-    return vehicle_locations
-
-
 if __name__ == '__main__':
     setup_base_log_dir(FLAGS.tag)
 
     if FLAGS.train:
         print("Set training mode")
-        dispatch_policy = DQNDispatchPolicyLearner()
-        dispatch_policy.build_q_network(load_network=FLAGS.load_network)
+        if FLAGS.async_learner:
+            # the learner process loads the memory and pretrains before the first weights are published
+            dispatch_policy = DQNDispatchPolicyActor()
+            dispatch_policy.build_q_network(load_network=FLAGS.load_network)
+        else:
+            dispatch_policy = DQNDispatchPolicyLearner()
+            dispatch_policy.build_q_network(load_network=FLAGS.load_network)
 
-        if FLAGS.load_memory:
-            dispatch_policy.load_experience_memory(FLAGS.load_memory)
+            if FLAGS.load_memory:
+                dispatch_policy.load_experience_memory(FLAGS.load_memory)
 
-        if FLAGS.pretrain > 0:
-            for i in range(FLAGS.pretrain):
-                average_loss, average_q_max = dispatch_policy.train_network(FLAGS.batch_size)
-                print("iterations : {}, average_loss : {:.3f}, average_q_max : {:.3f}".format(
-                    i, average_loss, average_q_max), flush=True)
-                dispatch_policy.q_network.write_summary(average_loss, average_q_max)
+            if FLAGS.pretrain > 0:
+                dispatch_policy.pretrain(FLAGS.pretrain, FLAGS.batch_size)
 
-    else:
+    elif FLAGS.workers == 0:
         dispatch_policy = DQNDispatchPolicy()
         if FLAGS.load_network:
             dispatch_policy.build_q_network(load_network=FLAGS.load_network)
@@ -68,23 +59,19 @@ if __name__ == '__main__':
         end_time = start_time + int(60 * 60 * 24 * FLAGS.days)
         print("End Datetime  : {}".format(get_local_datetime(end_time)))
 
-        matching_policy = GreedyMatchingPolicy()
-        dqn_exp = Experiment(start_time, TIMESTEP, dispatch_policy, matching_policy)
-        n_steps = int(3600 * 24 / TIMESTEP)
-        buffer_steps = int(3600 / TIMESTEP)
-
-        for _ in range(FLAGS.days):
-            vehicle_locations = sample_initial_locations(dqn_exp.simulator.get_current_time() + 3600 * 3)
-            dqn_exp.populate_vehicles(vehicle_locations)
-            for i in range(n_steps):
-                dqn_exp.step(verbose=FLAGS.verbose)
-
-        vehicle_locations = sample_initial_locations(dqn_exp.simulator.get_current_time() + 3600 * 3)
-        dqn_exp.populate_vehicles(vehicle_locations)
-        for i in range(buffer_steps):
-            dqn_exp.step(verbose=FLAGS.verbose)
+        if not FLAGS.train and FLAGS.workers > 0:
+            # days are independent in evaluation, so each one is simulated by a worker process
+            evaluate_days(start_time, FLAGS.days, FLAGS.workers, FLAGS.load_network, DEFAULT_LOG_DIR)
+        else:
+            dqn_exp = Experiment(start_time, TIMESTEP, dispatch_policy, create_matching_policy())
+            try:
+                simulate_days(dqn_exp, FLAGS.days, FLAGS.verbose)
+            finally:
+                dqn_exp.close()
 
         if FLAGS.train:
-            print("Dumping experience memory as pickle...")
+            print("Dumping experience memory...")
             dispatch_policy.dump_experience_memory()
 
+    if FLAGS.train and FLAGS.async_learner:
+        dispatch_policy.close()
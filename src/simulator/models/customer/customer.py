@@ -2,16 +2,13 @@ from logger import sim_logger
 from common import customer_status_codes
 
 class Customer(object):
+    __slots__ = ['request', 'status', 'waiting_time']
 
     def __init__(self, request):
         self.request = request
         self.status = customer_status_codes.CALLING
         self.waiting_time = 0
 
-    def step(self, timestep):
-        if self.status == customer_status_codes.CALLING:
-            self.disappear()
-
     def get_id(self):
         customer_id = self.request.id
         return customer_id
@@ -42,16 +39,9 @@ class Customer(object):
     def get_off(self):
         self.status = customer_status_codes.ARRIVED
 
-    def disappear(self):
-        self.status = customer_status_codes.DISAPPEARED
-        self.__log()
-
     def is_arrived(self):
         return self.status == customer_status_codes.ARRIVED
 
-    def is_disappeared(self):
-        return self.status == customer_status_codes.DISAPPEARED
-
     def make_payment(self):
         return self.request.fare
 
@@ -0,0 +1,64 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from common import customer_status_codes
+from .customer import Customer
+
+request_column_names = [
+    'id',
+    'request_datetime',
+    'trip_time',
+    'origin_lon',
+    'origin_lat',
+    'destination_lon',
+    'destination_lat',
+    'fare'
+]
+
+Request = namedtuple("Request", request_column_names)
+
+
+class CustomerBatch(object):
+    """Requests arrived in one step held as columns. Customer objects are created only for
+    the customers assigned to vehicles; the others disappear together at the next step."""
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.ids = requests['id']
+        self.size = len(self.ids)
+        self.status = np.full(self.size, customer_status_codes.CALLING, dtype=np.int8)
+        self.rows = {customer_id: i for i, customer_id in enumerate(self.ids.tolist())}
+
+    @classmethod
+    def from_records(cls, records):
+        columns = list(zip(*records)) if records else [[] for _ in request_column_names]
+        return cls({name: np.array(c) for name, c in zip(request_column_names, columns)})
+
+    @classmethod
+    def empty(cls):
+        return cls.from_records([])
+
+    @classmethod
+    def concatenate(cls, requests_list):
+        requests = {name: np.concatenate([r[name] for r in requests_list]) for name in request_column_names}
+        return cls(requests)
+
+    def get_request(self, i):
+        return Request(*[self.requests[name][i].item() for name in request_column_names])
+
+    def take_customer(self, customer_id):
+        """Creates Customer object of a calling customer and takes it out of the batch"""
+        i = self.rows.get(customer_id)
+        if i is None or self.status[i] != customer_status_codes.CALLING:
+            return None
+        self.status[i] = customer_status_codes.WAITING
+        return Customer(self.get_request(i))
+
+    def disappear(self):
+        """Makes all calling customers disappear and returns their ids"""
+        calling = self.status == customer_status_codes.CALLING
+        self.status[calling] = customer_status_codes.DISAPPEARED
+        return self.ids[calling]
+
+    def to_frame(self):
+        return pd.DataFrame(self.requests, columns=request_column_names).set_index("id")
@@ -1,36 +1,40 @@
-import pandas as pd
+from .customer_batch import CustomerBatch, request_column_names
+from logger import sim_logger
+from common import customer_status_codes
 
 
 class CustomerRepository(object):
-    request_column_names = [
-        'id',
-        'request_datetime',
-        'trip_time',
-        'origin_lon',
-        'origin_lat',
-        'destination_lon',
-        'destination_lat',
-        'fare'
-    ]
+    request_column_names = request_column_names
 
     customers = {}
-    new_customers = []
+    new_customers = CustomerBatch.empty()
 
 
     @classmethod
     def init(cls):
         cls.customers = {}
-        cls.new_customers = []
+        cls.new_customers = CustomerBatch.empty()
+
+    @classmethod
+    def step(cls, timestep):
+        """Customers who have not been assigned to any vehicle since the last step disappear"""
+        disappeared_ids = cls.new_customers.disappear()
+        status = customer_status_codes.DISAPPEARED
+        sim_logger.log_customer_events(["{},{},0".format(customer_id, status)
+                                        for customer_id in disappeared_ids.tolist()])
 
     @classmethod
     def update_customers(cls, customers):
         cls.new_customers = customers
-        for customer in customers:
-            cls.customers[customer.request.id] = customer
 
     @classmethod
     def get(cls, customer_id):
-        return cls.customers.get(customer_id, None)
+        customer = cls.customers.get(customer_id, None)
+        if customer is None:
+            customer = cls.new_customers.take_customer(customer_id)
+            if customer is not None:
+                cls.customers[customer_id] = customer
+        return customer
 
     @classmethod
     def get_all(cls):
@@ -38,11 +42,8 @@ class CustomerRepository(object):
 
     @classmethod
     def get_new_requests(cls):
-        requests = [customer.get_request() for customer in cls.new_customers]
-        df = pd.DataFrame.from_records(requests, columns=cls.request_column_names).set_index("id")
-        return df
+        return cls.new_customers.to_frame()
 
     @classmethod
     def delete(cls, customer_id):
         cls.customers.pop(customer_id)
-
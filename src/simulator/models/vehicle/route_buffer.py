@@ -0,0 +1,65 @@
+import numpy as np
+from common import geoutils
+
+
+class RouteBuffer(object):
+    """Packed storage of route polylines. Each route occupies a contiguous slice [start, end) of
+    the coordinate arrays. The cumulative distance array increases monotonically over the whole
+    buffer, so positions along many routes can be found with a single searchsorted call."""
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.size = 0
+        self.n_garbage = 0
+        self.lat = np.zeros(capacity)
+        self.lon = np.zeros(capacity)
+        self.cumdist = np.zeros(capacity)
+
+    def append(self, lats, lons):
+        """Stores a route and returns its slice and segment distances"""
+        n = len(lats)
+        if self.size + n > self.capacity:
+            self.__grow(self.size + n)
+        d = geoutils.great_circle_distance(lats[:-1], lons[:-1], lats[1:], lons[1:])
+        base = self.cumdist[self.size - 1] + 1.0 if self.size > 0 else 0.0
+        start, end = self.size, self.size + n
+        self.lat[start:end] = lats
+        self.lon[start:end] = lons
+        self.cumdist[start] = base
+        np.cumsum(d, out=self.cumdist[start + 1:end])
+        self.cumdist[start + 1:end] += base
+        self.size = end
+        return start, end, d
+
+    def release(self, start, end):
+        self.n_garbage += end - start
+
+    def needs_compaction(self, n):
+        return self.size + n > self.capacity and self.n_garbage * 2 > self.size
+
+    def compact(self, starts, ends):
+        """Drops released slices. Routes must be given in buffer order; returns their new starts."""
+        lengths = ends - starts
+        new_starts = np.zeros_like(starts)
+        np.cumsum(lengths[:-1], out=new_starts[1:])
+        total = int(lengths.sum())
+        index = np.repeat(starts - new_starts, lengths) + np.arange(total)
+        for name in ['lat', 'lon', 'cumdist']:
+            column = getattr(self, name)
+            column[:total] = column[index]
+        self.size = total
+        self.n_garbage = 0
+        return new_starts
+
+    def get_points(self, start, end):
+        return self.lat[start:end], self.lon[start:end]
+
+    def __grow(self, min_capacity):
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        for name in ['lat', 'lon', 'cumdist']:
+            column = np.zeros(capacity)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+        self.capacity = capacity
@@ -1,10 +1,8 @@
-from common import vehicle_status_codes, geoutils
-from config.settings import MIN_WORKING_TIME, MAX_WORKING_TIME
+from common import vehicle_status_codes
 from .vehicle_state import VehicleState
 from .vehicle_behavior import Occupied, Cruising, Idle, Assigned, OffDuty
 from logger import sim_logger
 from logging import getLogger
-import numpy as np
 from dqn.settings import FLAGS
 
 class Vehicle(object):
@@ -22,38 +20,41 @@ class Vehicle(object):
         self.state = vehicle_state
         self.__behavior = self.behavior_models[vehicle_state.status]
         self.__customers = []
-        self.__route_plan = []
-        self.earnings = 0
-        self.working_time = 0
-        self.duration = np.zeros(len(self.behavior_models))
 
+    @property
+    def earnings(self):
+        return self.state.earnings
+
+    @earnings.setter
+    def earnings(self, value):
+        self.state.earnings = value
+
+    @property
+    def working_time(self):
+        return self.state.working_time
+
+    @working_time.setter
+    def working_time(self, value):
+        self.state.working_time = value
+
+    @property
+    def duration(self):
+        return self.state.get_duration()
 
-    # state changing methods
-    def step(self, timestep):
-        self.working_time += timestep
-        if self.__behavior.available:
-            self.state.idle_duration += timestep
-        else:
-            self.state.idle_duration = 0
 
+    # state changing methods
+    def arrive(self):
+        """Called by VehicleRepository.step after the fleet timers have detected an arrival"""
         try:
-            self.__behavior.step(self, timestep)
+            self.__behavior.arrive(self)
         except:
-            logger = getLogger(__name__)
-            logger.error(self.state.to_msg())
+            self.__log_error()
             raise
 
-    def compute_speed(self, route, triptime):
-        lats, lons = zip(*route)
-        distance = geoutils.great_circle_distance(lats[:-1], lons[:-1], lats[1:], lons[1:])
-        speed = sum(distance) / triptime
-        return speed
-
     def cruise(self, route, triptime):
         assert self.__behavior.available
-        speed = self.compute_speed(route, triptime)
         self.__reset_plan()
-        self.__set_route(route, speed)
+        self.__set_route(route, triptime)
         self.__set_destination(route[-1], triptime)
         self.__change_to_cruising()
         self.__log()
@@ -102,22 +103,6 @@ class Vehicle(object):
         self.__change_to_idle()
         self.__log()
 
-    def update_location(self, location, route):
-        self.state.lat, self.state.lon = location
-        self.__route_plan = route
-
-    def update_time_to_destination(self, timestep):
-        dt = min(timestep, self.state.time_to_destination)
-        self.duration[self.state.status] += dt
-        self.state.time_to_destination -= dt
-        if self.state.time_to_destination <= 0:
-            self.state.time_to_destination = 0
-            self.state.lat = self.state.destination_lat
-            self.state.lon = self.state.destination_lon
-            return True
-        else:
-            return False
-
     # some getter methods
     def get_id(self):
         vehicle_id = self.state.id
@@ -140,7 +125,7 @@ class Vehicle(object):
         return customer_id
 
     def get_route(self):
-        return self.__route_plan[:]
+        return self.state.get_route()
 
     def get_idle_duration(self):
         duration = self.state.idle_duration
@@ -148,7 +133,7 @@ class Vehicle(object):
 
     def get_state(self):
         state = []
-        for attr in self.state.__slots__:
+        for attr in self.state.fields:
             state.append(getattr(self.state, attr))
         return state
 
@@ -156,23 +141,17 @@ class Vehicle(object):
         score = [self.working_time, self.earnings] + self.duration.tolist()
         return score
 
-    def exit_market(self):
-        if self.__behavior.available:
-            if self.state.idle_duration == 0:
-                return self.working_time > MIN_WORKING_TIME
-            else:
-                return self.working_time > MAX_WORKING_TIME
-        else:
-            return False
+    def is_available(self):
+        return self.__behavior.available
 
     def __reset_plan(self):
         self.state.reset_plan()
-        self.__route_plan = []
 
-    def __set_route(self, route, speed):
+    def __set_route(self, route, triptime):
         # assert self.get_location() == route[0]
-        self.__route_plan = route
-        self.state.speed = speed
+        # the first segment is from the current location to the beginning of the route
+        distance = self.state.set_route(route)
+        self.state.speed = distance[1:].sum() / triptime
 
     def __set_destination(self, destination, triptime):
         self.state.destination_lat, self.state.destination_lon = destination
@@ -198,6 +177,10 @@ class Vehicle(object):
         self.__behavior = self.behavior_models[status]
         self.state.status = status
 
+    def __log_error(self):
+        logger = getLogger(__name__)
+        logger.error(self.state.to_msg())
+
     def __log(self):
         if FLAGS.log_vehicle:
             sim_logger.log_vehicle_event(self.state.to_msg())
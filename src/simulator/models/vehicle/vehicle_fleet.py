@@ -0,0 +1,193 @@
+import numpy as np
+from common import vehicle_status_codes, geoutils
+from .route_buffer import RouteBuffer
+from .vehicle_index import VehicleIndex
+
+N_STATUS = 5
+
+class VehicleFleet(object):
+    """Columnar store of vehicle states. Row i of every column array belongs to the same vehicle
+    and rows [0, size) are kept dense so that the fleet can be stepped with array operations."""
+
+    columns = [
+        ('id', np.int64, 0),
+        ('lat', np.float64, 0),
+        ('lon', np.float64, 0),
+        ('speed', np.float64, 0),
+        ('status', np.int64, vehicle_status_codes.IDLE),
+        ('destination_lat', np.float64, np.nan),
+        ('destination_lon', np.float64, np.nan),
+        ('assigned_customer_id', np.int64, -1),
+        ('time_to_destination', np.float64, 0),
+        ('idle_duration', np.int64, 0),
+        ('earnings', np.float64, 0),
+        ('working_time', np.int64, 0),
+        ('route_start', np.int64, 0),
+        ('route_end', np.int64, 0),
+        ('route_distance', np.float64, 0)
+    ]
+    null_values = {name: null for name, _, null in columns if name in
+                   ('destination_lat', 'destination_lon', 'assigned_customer_id')}
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.size = 0
+        self.states = []
+        for name, dtype, default in self.columns:
+            setattr(self, name, np.full(capacity, default, dtype=dtype))
+        self.duration = np.zeros((capacity, N_STATUS))
+        self.routes = RouteBuffer()
+        self.index = VehicleIndex(self)
+
+    def allocate(self, state):
+        if self.size == self.capacity:
+            self.__grow()
+        row = self.size
+        for name, _, default in self.columns:
+            getattr(self, name)[row] = default
+        self.duration[row] = 0
+        self.states.append(state)
+        self.size += 1
+        return row
+
+    def release(self, row):
+        """Frees a row by moving the last row into its place"""
+        self.clear_route(row)
+        last = self.size - 1
+        self.index.release(row, last)
+        if row != last:
+            for name, _, _ in self.columns:
+                column = getattr(self, name)
+                column[row] = column[last]
+            self.duration[row] = self.duration[last]
+            moved = self.states[last]
+            moved.row = row
+            self.states[row] = moved
+        self.states.pop()
+        self.size -= 1
+
+    def __grow(self):
+        capacity = self.capacity * 2
+        for name, dtype, default in self.columns:
+            column = np.full(capacity, default, dtype=dtype)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+        duration = np.zeros((capacity, N_STATUS))
+        duration[:self.size] = self.duration[:self.size]
+        self.duration = duration
+        self.capacity = capacity
+
+    def set_route(self, row, route):
+        """Packs a route starting from the current location and returns distances of its segments"""
+        route = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+        self.clear_route(row)
+        n = len(route) + 1
+        if self.routes.needs_compaction(n):
+            self.__compact_routes()
+        lats = np.concatenate(([self.lat[row]], route[:, 0]))
+        lons = np.concatenate(([self.lon[row]], route[:, 1]))
+        start, end, d = self.routes.append(lats, lons)
+        self.route_start[row] = start
+        self.route_end[row] = end
+        self.route_distance[row] = 0
+        return d
+
+    def clear_route(self, row):
+        start, end = self.route_start[row], self.route_end[row]
+        if end > start:
+            self.routes.release(start, end)
+        self.route_start[row] = self.route_end[row] = 0
+        self.route_distance[row] = 0
+
+    def get_route(self, row):
+        """Returns the points of the route which the vehicle has not passed yet"""
+        start, end = self.route_start[row], self.route_end[row]
+        if end == start:
+            return []
+        cumdist = self.routes.cumdist
+        i = np.searchsorted(cumdist[start:end], cumdist[start] + self.route_distance[row], side='right')
+        lats, lons = self.routes.get_points(start + i, end)
+        return list(zip(lats.tolist(), lons.tolist()))
+
+    def drive(self, rows, timestep):
+        """Moves vehicles forward along their routes by speed * timestep"""
+        rows = rows[self.route_end[rows] > self.route_start[rows]]
+        if len(rows) == 0:
+            return
+        routes = self.routes
+        start, end = self.route_start[rows], self.route_end[rows]
+        distance = self.route_distance[rows] + self.speed[rows] * timestep
+        target = routes.cumdist[start] + distance
+        i = np.minimum(np.searchsorted(routes.cumdist[:routes.size], target, side='right') - 1, end - 1)
+
+        finished = i == end - 1
+        finished_rows = rows[finished]
+        self.lat[finished_rows] = routes.lat[end[finished] - 1]
+        self.lon[finished_rows] = routes.lon[end[finished] - 1]
+        for row in finished_rows:
+            self.clear_route(row)
+
+        moving = ~finished
+        rows, i, target = rows[moving], i[moving], target[moving]
+        lat0, lon0 = routes.lat[i], routes.lon[i]
+        bearing = geoutils.bearing(lat0, lon0, routes.lat[i + 1], routes.lon[i + 1])
+        self.lat[rows], self.lon[rows] = geoutils.end_location(lat0, lon0, target - routes.cumdist[i], bearing)
+        self.route_distance[rows] = distance[moving]
+
+    def __compact_routes(self):
+        n = self.size
+        rows = np.where(self.route_end[:n] > self.route_start[:n])[0]
+        rows = rows[np.argsort(self.route_start[rows])]
+        start, end = self.route_start[rows], self.route_end[rows]
+        new_start = self.routes.compact(start, end)
+        self.route_start[rows] = new_start
+        self.route_end[rows] = new_start + (end - start)
+
+    def get_snapshot(self, names):
+        """Returns read-only views of the given columns over the live rows"""
+        snapshot = {}
+        for name in names:
+            column = getattr(self, name)[:self.size]
+            column.flags.writeable = False
+            snapshot[name] = column
+        return snapshot
+
+    def get_available(self):
+        status = self.status[:self.size]
+        return (status == vehicle_status_codes.IDLE) | (status == vehicle_status_codes.CRUISING)
+
+    def get_index(self):
+        """Returns the spatial index of vehicles available for matching synced with the current locations"""
+        n = self.size
+        available = self.get_available() & (self.idle_duration[:n] > 0)
+        cells = np.where(available, VehicleIndex.get_cells(self.lat[:n], self.lon[:n]), -1)
+        self.index.update(cells)
+        return self.index
+
+    def step(self, timestep):
+        """Advances timers of all vehicles and returns rows of the vehicles arrived at their destinations"""
+        n = self.size
+        status = self.status[:n]
+        self.working_time[:n] += timestep
+        available = self.get_available()
+        self.idle_duration[:n] = np.where(available, self.idle_duration[:n] + timestep, 0)
+
+        rows = np.where(status != vehicle_status_codes.IDLE)[0]
+        time_to_destination = self.time_to_destination[rows]
+        dt = np.minimum(timestep, time_to_destination)
+        self.duration[rows, status[rows]] += dt
+        time_to_destination -= dt
+        arrived = time_to_destination <= 0
+        time_to_destination[arrived] = 0
+        self.time_to_destination[rows] = time_to_destination
+
+        arrived_rows = rows[arrived]
+        self.lat[arrived_rows] = self.destination_lat[arrived_rows]
+        self.lon[arrived_rows] = self.destination_lon[arrived_rows]
+        return arrived_rows
+
+    def get_exiting(self, min_working_time, max_working_time):
+        """Returns rows of available vehicles whose working time exceeds the limit"""
+        n = self.size
+        limit = np.where(self.idle_duration[:n] == 0, min_working_time, max_working_time)
+        return np.where(self.get_available() & (self.working_time[:n] > limit))[0]
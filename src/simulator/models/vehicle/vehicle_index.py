@@ -0,0 +1,128 @@
+import numpy as np
+from types import SimpleNamespace
+from common import mesh, geoutils
+from config.settings import MIN_LAT, DELTA_LAT, DELTA_LON, MAP_WIDTH, MAP_HEIGHT
+
+
+class VehicleIndex(object):
+    """Uniform grid of rows of available vehicles keyed by mesh cells.
+    Rows are moved only when their cell or availability changes, so syncing with the fleet costs
+    one array comparison plus the changed rows. Queries search rings of cells around a location."""
+
+    # lower bound of the cell size in meters, at the northern edge of the map
+    cell_size = min(geoutils.great_circle_distance(0, 0, DELTA_LAT, 0),
+                    geoutils.great_circle_distance(MIN_LAT + MAP_HEIGHT * DELTA_LAT, 0,
+                                                   MIN_LAT + MAP_HEIGHT * DELTA_LAT, DELTA_LON))
+    max_ring = max(MAP_WIDTH, MAP_HEIGHT)
+
+    def __init__(self, fleet):
+        # fleet provides id, lat and lon arrays indexed by row
+        self.fleet = fleet
+        self.cells = {}
+        self.row_cell = np.empty(0, dtype=np.int64)
+        self.n_rows = 0
+
+    @classmethod
+    def from_frame(cls, vehicles):
+        """Index of all vehicles in a frame with lat and lon columns indexed by vehicle id"""
+        points = SimpleNamespace(id=vehicles.index.values, lat=vehicles.lat.values, lon=vehicles.lon.values)
+        index = cls(points)
+        index.update(cls.get_cells(points.lat, points.lon))
+        return index
+
+    @staticmethod
+    def get_cells(lats, lons):
+        return mesh.lon2X(lons).astype(np.int64) * MAP_HEIGHT + mesh.lat2Y(lats)
+
+    def __len__(self):
+        return self.n_rows
+
+    def update(self, cells):
+        """Syncs with cells[row], the cell of each row or -1 if the vehicle is not available"""
+        n = len(cells)
+        if len(self.row_cell) < n:
+            self.row_cell = np.concatenate([self.row_cell, np.full(n - len(self.row_cell), -1, dtype=np.int64)])
+        changed = np.nonzero(self.row_cell[:n] != cells)[0]
+        for row, cell in zip(changed.tolist(), cells[changed].tolist()):
+            self.__remove(row)
+            if cell >= 0:
+                self.cells.setdefault(cell, set()).add(row)
+                self.row_cell[row] = cell
+                self.n_rows += 1
+
+    def release(self, row, last):
+        """Follows the fleet moving its last row into a released row"""
+        self.__remove(row)
+        if row != last and last < len(self.row_cell):
+            cell = self.row_cell[last]
+            if cell >= 0:
+                rows = self.cells[cell]
+                rows.discard(last)
+                rows.add(row)
+                self.row_cell[row] = cell
+                self.row_cell[last] = -1
+
+    def knn(self, lat, lon, k, max_distance=np.inf, exclude=()):
+        """Returns ids, latlons and distances of k nearest vehicles closer than max_distance
+        sorted by distance. Vehicles whose ids are in exclude are skipped."""
+        return self.__search(lat, lon, k, max_distance, exclude)
+
+    def radius(self, lat, lon, max_distance, exclude=()):
+        """Returns ids, latlons and distances of all vehicles closer than max_distance sorted by distance"""
+        return self.__search(lat, lon, None, max_distance, exclude)
+
+    def __search(self, lat, lon, k, max_distance, exclude):
+        x, y = mesh.convert_lonlat_to_xy(lon, lat)
+        fleet = self.fleet
+        found_rows = []
+        found_d = []
+        n_found = 0
+        for r in range(self.max_ring + 1):
+            rows = [row for cell in self.__get_ring(x, y, r) for row in self.cells.get(cell, ())]
+            if exclude:
+                rows = [row for row in rows if fleet.id[row] not in exclude]
+            if rows:
+                rows = np.array(rows)
+                d = geoutils.great_circle_distance(lat, lon, fleet.lat[rows], fleet.lon[rows])
+                within = d < max_distance
+                found_rows.append(rows[within])
+                found_d.append(d[within])
+                n_found += np.count_nonzero(within)
+
+            # vehicles in the next ring are at least r cells away
+            bound = r * self.cell_size
+            if bound >= max_distance:
+                break
+            if k is not None and n_found >= k and np.partition(np.concatenate(found_d), k - 1)[k - 1] <= bound:
+                break
+
+        if n_found == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, 2)), np.empty(0)
+        rows, d = np.concatenate(found_rows), np.concatenate(found_d)
+        order = np.argsort(d, kind='mergesort')[:k]
+        rows = rows[order]
+        return fleet.id[rows], np.stack([fleet.lat[rows], fleet.lon[rows]], axis=1), d[order]
+
+    def __get_ring(self, x, y, r):
+        if r == 0:
+            return [x * MAP_HEIGHT + y]
+        cells = []
+        for dx in range(-r, r + 1):
+            cx = x + dx
+            if cx < 0 or cx >= MAP_WIDTH:
+                continue
+            dys = range(-r, r + 1) if abs(dx) == r else (-r, r)
+            for dy in dys:
+                cy = y + dy
+                if 0 <= cy < MAP_HEIGHT:
+                    cells.append(cx * MAP_HEIGHT + cy)
+        return cells
+
+    def __remove(self, row):
+        if row >= len(self.row_cell):
+            return
+        cell = self.row_cell[row]
+        if cell >= 0:
+            self.cells[cell].discard(row)
+            self.row_cell[row] = -1
+            self.n_rows -= 1
@@ -1,17 +1,23 @@
 from .vehicle import Vehicle
 from .vehicle_state import VehicleState
+from .vehicle_fleet import VehicleFleet
+from common import vehicle_status_codes
+from config.settings import MIN_WORKING_TIME, MAX_WORKING_TIME
+import numpy as np
 import pandas as pd
 
 class VehicleRepository(object):
     vehicles = {}
+    fleet = VehicleFleet()
 
     @classmethod
     def init(cls):
         cls.vehicles = {}
+        cls.fleet = VehicleFleet()
 
     @classmethod
     def populate(cls, vehicle_id, location):
-        state = VehicleState(vehicle_id, location)
+        state = VehicleState(cls.fleet, vehicle_id, location)
         cls.vehicles[vehicle_id] = Vehicle(state)
 
     @classmethod
@@ -22,14 +28,47 @@ class VehicleRepository(object):
     def get(cls, vehicle_id):
         return cls.vehicles.get(vehicle_id, None)
 
+    @classmethod
+    def step(cls, timestep):
+        fleet = cls.fleet
+        cruising = fleet.status[:fleet.size] == vehicle_status_codes.CRUISING
+        arrived_rows = fleet.step(timestep)
+        cruising[arrived_rows] = False
+        fleet.drive(cruising.nonzero()[0], timestep)
+
+        arrived_vehicles = [cls.get_by_row(row) for row in arrived_rows]
+        for vehicle in arrived_vehicles:
+            vehicle.arrive()
+
+    @classmethod
+    def get_exiting(cls):
+        rows = cls.fleet.get_exiting(MIN_WORKING_TIME, MAX_WORKING_TIME)
+        return [cls.get_by_row(row) for row in rows]
+
+    @classmethod
+    def get_by_row(cls, row):
+        return cls.vehicles[cls.fleet.states[row].id]
+
+    @classmethod
+    def get_index(cls):
+        return cls.fleet.get_index()
+
     @classmethod
     def get_states(cls):
-        states = [vehicle.get_state() for vehicle in cls.get_all()]
-        cols = VehicleState.__slots__[:]
-        df = pd.DataFrame.from_records(states, columns=cols).set_index("id")
-        df["earnings"] = [vehicle.earnings for vehicle in cls.get_all()]
+        """Returns a frame of the states of all vehicles indexed by id, copied once from views of the fleet columns.
+        The frame is a copy since the agent marks matched vehicles on it, and Experiment.step reads the statuses
+        at the start of the step after matching and dispatching have updated the fleet."""
+        snapshot = cls.fleet.get_snapshot(VehicleState.fields + ["earnings"])
+        index = pd.Index(snapshot.pop("id"), name="id")
+        # vehicles without a customer hold the null value of the fleet column
+        customer_ids = snapshot["assigned_customer_id"]
+        snapshot["assigned_customer_id"] = np.where(customer_ids == VehicleFleet.null_values["assigned_customer_id"],
+                                                    np.nan, customer_ids)
+        cols = VehicleState.fields[1:] + ["earnings"]
+        df = pd.DataFrame(snapshot, index=index, columns=cols)
         return df
 
     @classmethod
     def delete(cls, vehicle_id):
-        cls.vehicles.pop(vehicle_id)
+        vehicle = cls.vehicles.pop(vehicle_id)
+        cls.fleet.release(vehicle.state.row)
@@ -1,13 +1,52 @@
 from common import vehicle_status_codes
+from .vehicle_fleet import VehicleFleet
+
+
+class Column(object):
+    """Attribute bound to one column of the fleet store"""
+
+    def __init__(self, name):
+        self.name = name
+        self.null = VehicleFleet.null_values.get(name)
+
+    def __get__(self, state, owner):
+        if state is None:
+            return self
+        value = getattr(state.fleet, self.name)[state.row].item()
+        if self.null is not None and (value == self.null or value != value):
+            return None
+        return value
+
+    def __set__(self, state, value):
+        if value is None:
+            value = self.null
+        getattr(state.fleet, self.name)[state.row] = value
 
 
 class VehicleState(object):
-    __slots__ = [
+    """View over one row of VehicleFleet"""
+    fields = [
         'id', 'lat', 'lon', 'speed', 'status', 'destination_lat', 'destination_lon',
         'assigned_customer_id', 'time_to_destination', 'idle_duration'
     ]
+    __slots__ = ['fleet', 'row']
 
-    def __init__(self, id, location):
+    id = Column('id')
+    lat = Column('lat')
+    lon = Column('lon')
+    speed = Column('speed')
+    status = Column('status')
+    destination_lat = Column('destination_lat')
+    destination_lon = Column('destination_lon')
+    assigned_customer_id = Column('assigned_customer_id')
+    time_to_destination = Column('time_to_destination')
+    idle_duration = Column('idle_duration')
+    earnings = Column('earnings')
+    working_time = Column('working_time')
+
+    def __init__(self, fleet, id, location):
+        self.fleet = fleet
+        self.row = fleet.allocate(self)
         self.id = id
         self.lat, self.lon = location
         self.speed = 0
@@ -23,8 +62,20 @@ class VehicleState(object):
         self.speed = 0
         self.assigned_customer_id = None
         self.time_to_destination = 0
+        self.clear_route()
+
+    def set_route(self, route):
+        return self.fleet.set_route(self.row, route)
+
+    def clear_route(self):
+        self.fleet.clear_route(self.row)
+
+    def get_route(self):
+        return self.fleet.get_route(self.row)
 
+    def get_duration(self):
+        return self.fleet.duration[self.row]
 
     def to_msg(self):
-        state = [str(getattr(self, name)) for name in self.__slots__]
+        state = [str(getattr(self, name)) for name in self.fields]
         return ','.join(state)
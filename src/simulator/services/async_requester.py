@@ -1,31 +1,47 @@
 """Asynchronous request module"""
 from concurrent import futures
-import itertools
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 class AsyncRequester(object):
     """Send asynchronous requests to list of urls
     Response time may be limited by rate of system/NW"""
-    def __init__(self, n_threads):
+    def __init__(self, n_threads, timeout=10.0, max_retries=3, backoff_factor=0.1):
         # self.urllist = []
         self.n_threads = n_threads
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
         self.executor = futures.ThreadPoolExecutor(max_workers=self.n_threads)
+        self.local = threading.local()
+
+    def create_session(self):
+        """Session whose connection is kept alive across the requests of a thread"""
+        retry = Retry(total=self.max_retries, backoff_factor=self.backoff_factor,
+                      status_forcelist=(500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get_session(self):
+        """Session of the calling thread, since requests does not guarantee that a session is thread-safe"""
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.create_session()
+        return session
 
     def send_async_requests(self, urllist):
-        """Sends asynchronous requests"""
+        """Sends asynchronous requests
+        Each url is a separate task, so idle threads pick up the next url instead of waiting for a slow batch"""
         if len(urllist) == 1:
-            return self.get_batch(urllist)
-        n_batches = int(len(urllist) / self.n_threads) + 1
-        batch_urllist = [urllist[i * n_batches : (i + 1) * n_batches]
-                        for i in range(self.n_threads)]
-        responses = list(self.executor.map(self.get_batch, batch_urllist))
-        return list(itertools.chain(*responses))
+            return [self.get_json(urllist[0])]
+        return list(self.executor.map(self.get_json, urllist))
 
-    def get_json(cls, url):
+    def get_json(self, url):
         """open URL and return JSON contents"""
-        result = requests.get(url).json()
+        result = self.get_session().get(url, timeout=self.timeout).json()
         return result
-
-    def get_batch(self, urllist):
-        """Batch processing for get method; takes list of urls as input"""
-        return [self.get_json(url) for url in urllist]
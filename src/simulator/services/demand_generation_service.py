@@ -1,5 +1,10 @@
-from simulator.models.customer.customer import Customer
-from db import Session
+from concurrent import futures
+import numpy as np
+import pandas as pd
+from simulator.models.customer.customer_batch import CustomerBatch, Request
+from .request_backlog import RequestBacklog
+from config.settings import DEMAND_REPLAY_CHUNK, REQUEST_BACKLOG_DIR
+from db import Session, engine
 
 query = """
   SELECT *
@@ -7,21 +12,54 @@ query = """
   WHERE request_datetime >= {t1} and request_datetime < {t2};
 """
 
+chunk_query = """
+  SELECT {columns}
+  FROM {table}
+  WHERE request_datetime >= {t1} and request_datetime < {t2}
+  ORDER BY request_datetime;
+"""
+
+class RequestChunk(object):
+    """Requests in [t_start, t_end) held as columns sorted by request_datetime"""
+
+    def __init__(self, t_start, t_end, df):
+        self.t_start = t_start
+        self.t_end = t_end
+        self.columns = [df[name].values for name in Request._fields]
+        self.request_datetime = df.request_datetime.values
+
+    def slice(self, t1, t2):
+        lo, hi = np.searchsorted(self.request_datetime, [t1, t2], side='left')
+        return {name: c[lo:hi] for name, c in zip(Request._fields, self.columns)}
+
 
 class DemandGenerator(object):
 
 
-    def __init__(self, use_pattern=False):
+    def __init__(self, use_pattern=False, replay=True, chunk_size=DEMAND_REPLAY_CHUNK):
         if use_pattern:
             self.table = "request_pattern"
         else:
             self.table = "request_backlog"
+        self.replay = replay
+        self.backlog = None
+        if replay and not use_pattern and RequestBacklog.exists(REQUEST_BACKLOG_DIR):
+            self.backlog = RequestBacklog(REQUEST_BACKLOG_DIR)
+        self.chunk_size = chunk_size
+        self.chunk = None
+        self.next_chunk = None
+        # created on the first prefetch, since replaying from the memory-mapped backlog needs none
+        self.executor = None
 
 
     def generate(self, current_time, timestep):
+        if self.replay:
+            return self.replay_requests(current_time, current_time + timestep)
+
         try:
             requests = Session.execute(query.format(table=self.table, t1=current_time, t2=current_time + timestep))
-            customers = [Customer(request) for request in requests]
+            customers = CustomerBatch.from_records([tuple(request[name] for name in Request._fields)
+                                                    for request in requests])
         except:
             Session.rollback()
             raise
@@ -29,4 +67,45 @@ class DemandGenerator(object):
             Session.remove()
         return customers
 
+    def replay_requests(self, t1, t2):
+        if self.backlog is not None:
+            return CustomerBatch(self.backlog.slice(t1, t2))
+
+        requests = []
+        while t1 < t2:
+            chunk = self.get_chunk(t1)
+            t = min(t2, chunk.t_end)
+            requests.append(chunk.slice(t1, t))
+            t1 = t
+        if len(requests) == 1:
+            return CustomerBatch(requests[0])
+        return CustomerBatch.concatenate(requests)
+
+    def get_chunk(self, t):
+        if self.chunk is not None and self.chunk.t_start <= t < self.chunk.t_end:
+            return self.chunk
+
+        if self.next_chunk is not None and self.next_chunk[0] == t:
+            chunk = self.next_chunk[1].result()
+        else:
+            chunk = self.load_chunk(t, t + self.chunk_size)
+        self.chunk = chunk
+        if self.executor is None:
+            self.executor = futures.ThreadPoolExecutor(max_workers=1)
+        self.next_chunk = (chunk.t_end, self.executor.submit(
+            self.load_chunk, chunk.t_end, chunk.t_end + self.chunk_size))
+        return chunk
+
+    def close(self):
+        """Cancels the prefetch of the next chunk and releases the loader thread without waiting for it"""
+        if self.next_chunk is not None:
+            self.next_chunk[1].cancel()
+            self.next_chunk = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
 
+    def load_chunk(self, t1, t2):
+        df = pd.read_sql(chunk_query.format(columns=", ".join(Request._fields), table=self.table, t1=t1, t2=t2),
+                         engine)
+        return RequestChunk(t1, t2, df)
@@ -1,15 +1,23 @@
 """Modified RoutingService.route to accept od_pairs list and make asynchronous requests to it"""
 
+import asyncio
+import threading
 import polyline
+from collections import OrderedDict
 from .async_requester import AsyncRequester
-from config.settings import OSRM_HOSTPORT
+from .route_cache import LRUCache
+from config.settings import OSRM_HOSTPORT, OSRM_CACHE_SIZE, OSRM_CACHE_PATH
 from common.mesh import convert_xy_to_lonlat
 
+# asyncio.all_tasks is new in Python 3.7
+all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+
 class OSRMEngine(object):
     """Sends and parses asynchronous requests from list of O-D pairs"""
-    def __init__(self, n_threads=8):
+    def __init__(self, n_threads=8, cache_size=OSRM_CACHE_SIZE, cache_path=OSRM_CACHE_PATH, precision=5):
         self.async_requester = AsyncRequester(n_threads)
-        self.route_cache = {}
+        self.cache = LRUCache(cache_size, cache_path)
+        self.precision = precision
 
     def nearest_road(self, points):
         """Input list of Origin-Destination latlong pairs, return
@@ -25,66 +33,107 @@ class OSRMEngine(object):
 
         return resultlist
 
-    def route(self, od_list, decode=True):
-        """Input list of Origin-Destination latlong pairs, return
-        tuple of (trajectory latlongs, distance, triptime)"""
-        urllist = [self.get_route_url(origin, destin) for origin, destin in od_list]
-        responses = self.async_requester.send_async_requests(urllist)
-        resultlist = []
-        for res in responses:
+    def quantize(self, latlon):
+        return tuple(int(round(c * 10 ** self.precision)) for c in latlon)
+
+    def quantize_all(self, latlon_list):
+        return tuple(self.quantize(latlon) for latlon in latlon_list)
+
+    def lookup(self, keys):
+        """Returns cached results of keys (None if missing) and the indices of each missing key"""
+        results = [self.cache.get(key) for key in keys]
+        missing = OrderedDict()
+        for i, result in enumerate(results):
+            if result is None:
+                missing.setdefault(keys[i], []).append(i)
+        return results, missing
+
+    def store(self, results, missing, responses, parse):
+        """Parses responses to the missing keys and fills them in results and cache"""
+        for (key, ids), res in zip(missing.items(), responses):
+            result = parse(res)
+            self.cache.put(key, result)
+            for i in ids:
+                results[i] = result
+        return results
+
+    def cached_requests(self, keys, create_url, parse):
+        """Returns cached results of keys and requests only the missing ones.
+        create_url(i) and parse(response) build the url of the i-th query and its result."""
+        results, missing = self.lookup(keys)
+        if missing:
+            responses = self.async_requester.send_async_requests([create_url(ids[0]) for ids in missing.values()])
+            self.store(results, missing, responses, parse)
+        return results
+
+    def route_queries(self, od_list, decode=True):
+        def parse(res):
             route = res["routes"][0]
             triptime = route["duration"]
             if decode:
                 trajectory = polyline.decode(route['geometry'])
             else:
                 trajectory = route['geometry']
-            resultlist.append((trajectory, triptime))
+            return trajectory, triptime
+
+        keys = [("route", self.quantize(origin), self.quantize(destin), decode) for origin, destin in od_list]
+        return keys, lambda i: self.get_route_url(*od_list[i]), parse
+
+    def eta_one_to_many_queries(self, origin_destins_list):
+        keys = [("eta_one_to_many", self.quantize(origin), self.quantize_all(destins))
+                for origin, destins in origin_destins_list]
+        return (keys,
+                lambda i: self.get_eta_one_to_many_url([origin_destins_list[i][0]] + origin_destins_list[i][1]),
+                lambda res: res["durations"][0][1:])
+
+    def eta_many_to_one_queries(self, origins_destin_list):
+        keys = [("eta_many_to_one", self.quantize_all(origins), self.quantize(destin))
+                for origins, destin in origins_destin_list]
+        return (keys,
+                lambda i: self.get_eta_one_to_many_url(origins_destin_list[i][0] + [origins_destin_list[i][1]]),
+                lambda res: [d[0] for d in res["durations"][:-1]])
+
+    def eta_many_to_many_queries(self, problems):
+        def parse(res):
+            try:
+                return res["durations"]
+            except KeyError as e:
+                # a failed query returns a code and a message instead of durations
+                raise ValueError("OSRM table query failed: {}".format(res)) from e
+
+        keys = [("eta_many_to_many", self.quantize_all(origins), self.quantize_all(destins))
+                for origins, destins in problems]
+        return keys, lambda i: self.get_eta_many_to_many_url(*problems[i]), parse
 
-        return resultlist
+    def route(self, od_list, decode=True):
+        """Input list of Origin-Destination latlong pairs, return
+        tuple of (trajectory latlongs, distance, triptime)"""
+        return self.cached_requests(*self.route_queries(od_list, decode))
 
     def get_route_cache(self, l, a):
-        if l in self.route_cache:
-            if a in self.route_cache[l]:
-                trajectory, triptime = self.route_cache[l][a]
-                return trajectory[:], triptime
-        else:
-            self.route_cache[l] = {}
         x, y = l
         ax, ay = a
         origin = convert_xy_to_lonlat(x, y)
         destin = convert_xy_to_lonlat(x + ax, y + ay)
-        self.route_cache[l][a] = self.route([(origin, destin)])[0]
-        trajectory, triptime = self.route_cache[l][a]
+        trajectory, triptime = self.route([(origin, destin)])[0]
         return trajectory[:], triptime
 
 
     def eta_one_to_many(self, origin_destins_list):
-        urllist = [self.get_eta_one_to_many_url([origin] + destins) for origin, destins in origin_destins_list]
-        responses = self.async_requester.send_async_requests(urllist)
-        resultlist = []
-        for res in responses:
-            eta_list = res["durations"][0][1:]
-            resultlist.append(eta_list)
-        return resultlist
+        return self.cached_requests(*self.eta_one_to_many_queries(origin_destins_list))
 
     def eta_many_to_one(self, origins_destin_list):
-        urllist = [self.get_eta_one_to_many_url(origins + [destin]) for origins, destin in origins_destin_list]
-        responses = self.async_requester.send_async_requests(urllist)
-        resultlist = []
-        for res in responses:
-            eta_list = [d[0] for d in res["durations"][:-1]]
-            resultlist.append(eta_list)
-        return resultlist
+        return self.cached_requests(*self.eta_many_to_one_queries(origins_destin_list))
 
     def eta_many_to_many(self, origins, destins):
-        url = self.get_eta_many_to_many_url(origins, destins)
-        res = self.async_requester.send_async_requests([url])[0]
-        try:
-            eta_matrix = res["durations"]
-        except:
-            print(origins, destins, res)
-            raise
-        return eta_matrix
+        return self.eta_many_to_many_batch([(origins, destins)])[0]
+
+    def eta_many_to_many_batch(self, problems):
+        """ETA matrices of a list of (origins, destins); uncached ones are requested concurrently"""
+        return self.cached_requests(*self.eta_many_to_many_queries(problems))
+
+    def get_cache_stats(self):
+        return self.cache.get_stats()
 
 
     def get_route_url(cls, from_latlon, to_latlon):
@@ -131,4 +180,61 @@ class OSRMEngine(object):
             sources=';'.join(map(str, ids[:len(from_latlon_list)])),
             destins=';'.join(map(str, ids[len(from_latlon_list):]))
         )
-        return urlholder
\ No newline at end of file
+        return urlholder
+
+class AsyncOSRMEngine(object):
+    """Awaitable version of OSRMEngine sharing its cache and connection pool.
+    Coroutines run on a background event loop, so the simulation can submit queries
+    and collect the results after doing other work."""
+    def __init__(self, engine):
+        self.engine = engine
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        """Schedules coro on the background loop and returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def fetch(self, urllist):
+        loop = asyncio.get_event_loop()
+        requester = self.engine.async_requester
+        tasks = [loop.run_in_executor(requester.executor, requester.get_json, url) for url in urllist]
+        return await asyncio.gather(*tasks)
+
+    async def cached_requests(self, keys, create_url, parse):
+        results, missing = self.engine.lookup(keys)
+        if missing:
+            responses = await self.fetch([create_url(ids[0]) for ids in missing.values()])
+            self.engine.store(results, missing, responses, parse)
+        return results
+
+    async def route(self, od_list, decode=True):
+        return await self.cached_requests(*self.engine.route_queries(od_list, decode))
+
+    async def eta_one_to_many(self, origin_destins_list):
+        return await self.cached_requests(*self.engine.eta_one_to_many_queries(origin_destins_list))
+
+    async def eta_many_to_one(self, origins_destin_list):
+        return await self.cached_requests(*self.engine.eta_many_to_one_queries(origins_destin_list))
+
+    async def eta_many_to_many(self, origins, destins):
+        results = await self.eta_many_to_many_batch([(origins, destins)])
+        return results[0]
+
+    async def eta_many_to_many_batch(self, problems):
+        return await self.cached_requests(*self.engine.eta_many_to_many_queries(problems))
+
+    def close(self):
+        """Stops the background loop, cancels coroutines still pending on it and closes it.
+        Requests go through the requester of the engine, which outlives this object."""
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        pending = [task for task in all_tasks(self.loop) if not task.done()]
+        for task in pending:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.loop.close()
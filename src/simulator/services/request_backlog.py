@@ -0,0 +1,70 @@
+"""Columnar on-disk format of the request backlog.
+Each column is stored as a fixed-width .npy file and opened with np.memmap, so that the
+simulator reads only the pages of the requested time window."""
+import os
+import json
+import numpy as np
+from simulator.models.customer.customer_batch import Request
+
+column_dtypes = {
+    'id': np.int32,
+    'request_datetime': np.int32,
+    'trip_time': np.int32,
+    'origin_lon': np.float32,
+    'origin_lat': np.float32,
+    'destination_lon': np.float32,
+    'destination_lat': np.float32,
+    'fare': np.float32
+}
+
+META_FILE = "meta.json"
+TIME_INDEX_FILE = "time_index.npy"
+
+
+def write_request_backlog(df, path, bucket=60):
+    """Writes a DataFrame of requests indexed by id to path"""
+    if not os.path.exists(path):
+        os.makedirs(path)
+    df = df.reset_index().sort_values(by='request_datetime', kind='mergesort')
+    for name in Request._fields:
+        np.save(os.path.join(path, name), df[name].values.astype(column_dtypes[name]))
+
+    request_datetime = df.request_datetime.values
+    t_start = int(request_datetime[0] // bucket * bucket) if len(df) > 0 else 0
+    n_buckets = int((request_datetime[-1] - t_start) // bucket) + 2 if len(df) > 0 else 1
+    time_index = np.searchsorted(request_datetime, t_start + np.arange(n_buckets) * bucket, side='left')
+    np.save(os.path.join(path, TIME_INDEX_FILE), time_index.astype(np.int64))
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump({'t_start': t_start, 'bucket': bucket, 'n_rows': len(df)}, f)
+
+
+class RequestBacklog(object):
+    """Read-only memory-mapped view of a backlog written by write_request_backlog"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.t_start = meta['t_start']
+        self.bucket = meta['bucket']
+        self.columns = [np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in Request._fields]
+        self.request_datetime = self.columns[Request._fields.index('request_datetime')]
+        self.time_index = np.load(os.path.join(path, TIME_INDEX_FILE), mmap_mode='r')
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, META_FILE))
+
+    def locate(self, t):
+        """Returns the first row whose request_datetime is not earlier than t"""
+        k = (t - self.t_start) // self.bucket
+        if k < 0:
+            return 0
+        if k >= len(self.time_index) - 1:
+            return int(self.time_index[-1])
+        lo, hi = self.time_index[k], self.time_index[k + 1]
+        return int(lo + np.searchsorted(self.request_datetime[lo:hi], t, side='left'))
+
+    def slice(self, t1, t2):
+        """Returns columns of the requests in [t1, t2)"""
+        lo, hi = self.locate(t1), self.locate(t2)
+        return {name: np.array(c[lo:hi]) for name, c in zip(Request._fields, self.columns)}
@@ -0,0 +1,73 @@
+"""LRU cache of routing results with optional persistence in SQLite"""
+import atexit
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+
+    def __init__(self, max_size=100000, path=None, commit_interval=1000):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.commit_interval = commit_interval
+        self.n_uncommitted = 0
+        self.db = None
+        # shared by the simulation and the background loop of AsyncOSRMEngine
+        self.lock = threading.RLock()
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB)")
+            atexit.register(self.flush)
+
+    def get(self, key):
+        with self.lock:
+            return self.__get(key)
+
+    def put(self, key, value):
+        with self.lock:
+            self.__put(key, value)
+
+    def flush(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.commit()
+                self.n_uncommitted = 0
+
+    def get_stats(self):
+        return {"size": len(self.items), "hits": self.hits, "misses": self.misses}
+
+    def __get(self, key):
+        if key in self.items:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key]
+
+        if self.db is not None:
+            row = self.db.execute("SELECT value FROM cache WHERE key = ?", (repr(key),)).fetchone()
+            if row is not None:
+                value = pickle.loads(row[0])
+                self.__set(key, value)
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def __put(self, key, value):
+        self.__set(key, value)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                            (repr(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+            self.n_uncommitted += 1
+            if self.n_uncommitted >= self.commit_interval:
+                self.flush()
+
+    def __set(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
@@ -0,0 +1,41 @@
+"""Cell-to-cell route geometries decoded into one packed coordinate array.
+route_coords.npy holds (lat, lon) points of all routes as float32 and route_index.npy holds
+[start, end) offsets of the route from cell (x, y) by action (axi, ayi)."""
+import os
+import numpy as np
+import polyline
+
+ROUTE_COORDS_FILE = "route_coords.npy"
+ROUTE_INDEX_FILE = "route_index.npy"
+
+
+def write_route_table(routes, shape, max_move, path):
+    """Decodes routes given as {(x, y): {(ax, ay): encoded polyline}} and writes them to path"""
+    index = np.zeros(shape + (2,), dtype=np.int64)
+    coords = []
+    n = 0
+    for x, y, axi, ayi in np.ndindex(*shape):
+        encoded = routes.get((x, y), {}).get((axi - max_move, ayi - max_move))
+        points = polyline.decode(encoded) if encoded else []
+        index[x, y, axi, ayi] = n, n + len(points)
+        coords += points
+        n += len(points)
+    coords = np.array(coords, dtype=np.float32).reshape(-1, 2)
+    np.save(os.path.join(path, ROUTE_COORDS_FILE), coords)
+    np.save(os.path.join(path, ROUTE_INDEX_FILE), index)
+
+
+class RouteTable(object):
+
+    def __init__(self, path):
+        self.coords = np.load(os.path.join(path, ROUTE_COORDS_FILE), mmap_mode='r')
+        self.index = np.load(os.path.join(path, ROUTE_INDEX_FILE), mmap_mode='r')
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, ROUTE_INDEX_FILE))
+
+    def get(self, x, y, axi, ayi):
+        """Returns a read-only (n, 2) view of the route points"""
+        start, end = self.index[x, y, axi, ayi]
+        return self.coords[start:end]
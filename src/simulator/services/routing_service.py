@@ -1,9 +1,10 @@
 import os
 import pickle
 import numpy as np
-from config.settings import DATA_DIR
-from common import mesh, geoutils
+from config.settings import DATA_DIR, MIN_LAT, MIN_LON, DELTA_LAT, DELTA_LON
+from common import mesh, geoutils, cache
 from .osrm_engine import OSRMEngine
+from .route_table import RouteTable
 from dqn.settings import FLAGS, MAX_MOVE
 import polyline
 
@@ -23,23 +24,29 @@ class RoutingEngine(object):
 class FastRoutingEngine(object):
 
     def __init__(self):
-        self.tt_map = np.load(os.path.join(DATA_DIR, 'tt_map.npy'))
-        self.routes = pickle.load(open(os.path.join(DATA_DIR, 'routes.pkl'), 'rb'))
+        self.tt_map = np.load(os.path.join(DATA_DIR, 'tt_map.npy'), mmap_mode='r')
+        self.__routes = None
+        self.route_table = RouteTable(DATA_DIR) if RouteTable.exists(DATA_DIR) else None
+        key = (MIN_LAT, MIN_LON, DELTA_LAT, DELTA_LON, self.tt_map.shape, MAX_MOVE)
+        self.ref_d = cache.load_or_compute("ref_d", key, lambda: self.compute_ref_distance(self.tt_map.shape))
 
-        d = self.tt_map.copy()
-        for x in range(d.shape[0]):
-            origin_lon = mesh.X2lon(x)
-            for y in range(d.shape[1]):
-                origin_lat = mesh.Y2lat(y)
-                for axi in range(d.shape[2]):
-                    x_ = x + axi - MAX_MOVE
-                    destin_lon = mesh.X2lon(x_)
-                    for ayi in range(d.shape[3]):
-                        y_ = y + ayi - MAX_MOVE
-                        destin_lat = mesh.Y2lat(y_)
-                        d[x, y, axi, ayi] = geoutils.great_circle_distance(
-                            origin_lat, origin_lon, destin_lat, destin_lon)
-        self.ref_d = d
+    @property
+    def routes(self):
+        # routes are loaded on first use so that engines used only for ETA start quickly
+        if self.__routes is None:
+            with open(os.path.join(DATA_DIR, 'routes.pkl'), 'rb') as f:
+                self.__routes = pickle.load(f)
+        return self.__routes
+
+    @staticmethod
+    def compute_ref_distance(shape):
+        """Distances between the center of each cell and the centers of cells within MAX_MOVE"""
+        width, height, a_width, a_height = shape
+        x = np.arange(width)[:, None, None, None]
+        y = np.arange(height)[None, :, None, None]
+        ax = np.arange(a_width)[None, None, :, None] - MAX_MOVE
+        ay = np.arange(a_height)[None, None, None, :] - MAX_MOVE
+        return geoutils.great_circle_distance(mesh.Y2lat(y), mesh.X2lon(x), mesh.Y2lat(y + ay), mesh.X2lon(x + ax))
 
     def route(self, od_pairs):
         results = []
@@ -49,31 +56,46 @@ class FastRoutingEngine(object):
             ax, ay = x_ - x, y_ - y
             axi = x_ - x + MAX_MOVE
             ayi = y_ - y + MAX_MOVE
-            trajectory = polyline.decode(self.routes[(x, y)][(ax, ay)])
+            if self.route_table is not None:
+                trajectory = self.route_table.get(x, y, axi, ayi)
+            else:
+                trajectory = polyline.decode(self.routes[(x, y)][(ax, ay)])
             triptime = self.tt_map[x, y, axi, ayi]
             results.append((trajectory, triptime))
         return results
 
     def eta_many_to_many(self, origins, destins, max_distance=5000, ref_speed=5.0):
-        T = np.full((len(origins), len(destins)), np.inf)
-        origins_lat, origins_lon = zip(*origins)
-        destins_lat, destins_lon = zip(*destins)
-        origins_lat, origins_lon, destins_lat, destins_lon = map(np.array, [origins_lat, origins_lon, destins_lat, destins_lon])
-        origins_x, origins_y = mesh.lon2X(origins_lon), mesh.lat2Y(origins_lat)
-        destins_x, destins_y = mesh.lon2X(destins_lon), mesh.lat2Y(destins_lat)
-        d = geoutils.great_circle_distance(origins_lat[:, None], origins_lon[:, None],
-                                           destins_lat, destins_lon)
+        return self.eta_many_to_many_batch([(origins, destins)], max_distance, ref_speed)[0]
+
+    def eta_many_to_many_batch(self, problems, max_distance=5000, ref_speed=5.0):
+        """Returns ETA matrices of a list of (origins, destins) in one vectorized lookup"""
+        if not problems:
+            return []
+        shapes = [(len(origins), len(destins)) for origins, destins in problems]
+        O = np.concatenate([np.repeat(np.array(origins, dtype=np.float64), len(destins), axis=0)
+                            for origins, destins in problems])
+        D = np.concatenate([np.tile(np.array(destins, dtype=np.float64), (len(origins), 1))
+                            for origins, destins in problems])
+        T = self.eta_pairs(O[:, 0], O[:, 1], D[:, 0], D[:, 1], max_distance, ref_speed)
+        sections = np.cumsum([n * m for n, m in shapes])[:-1]
+        return [t.reshape(shape) for t, shape in zip(np.split(T, sections), shapes)]
+
+    def eta_pairs(self, origins_lat, origins_lon, destins_lat, destins_lon, max_distance=5000, ref_speed=5.0):
+        """ETA of each origin-destination pair; inf if farther than max_distance or out of tt_map range"""
+        T = np.full(len(origins_lat), np.inf)
+        d = geoutils.great_circle_distance(origins_lat, origins_lon, destins_lat, destins_lon)
+
+        k = np.nonzero(d < max_distance)[0]
+        x, y = mesh.lon2X(origins_lon[k]), mesh.lat2Y(origins_lat[k])
+        axi = mesh.lon2X(destins_lon[k]) - x + MAX_MOVE
+        ayi = mesh.lat2Y(destins_lat[k]) - y + MAX_MOVE
+        in_range = (0 <= axi) & (axi <= 2 * MAX_MOVE) & (0 <= ayi) & (ayi <= 2 * MAX_MOVE)
+        k, x, y, axi, ayi = [v[in_range] for v in (k, x, y, axi, ayi)]
 
-        for i, (x, y) in enumerate(zip(origins_x, origins_y)):
-            for j in np.where(d[i] < max_distance)[0]:
-                axi = destins_x[j] - x + MAX_MOVE
-                ayi = destins_y[j] - y + MAX_MOVE
-                if 0 <= axi and axi <= 2 * MAX_MOVE and 0 <= ayi and ayi <= 2 * MAX_MOVE:
-                    ref_d = self.ref_d[x, y, axi, ayi]
-                    if ref_d == 0:
-                        T[i, j] = d[i, j] / ref_speed
-                    else:
-                        T[i, j] = self.tt_map[x, y, axi, ayi] * d[i, j] / ref_d
+        ref_d = self.ref_d[x, y, axi, ayi]
+        d_k = d[k]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            T[k] = np.where(ref_d == 0, d_k / ref_speed, self.tt_map[x, y, axi, ayi] * d_k / ref_d)
         return T
 
 
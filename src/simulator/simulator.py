@@ -3,6 +3,8 @@ from .models.vehicle.vehicle_repository import VehicleRepository
 from .models.customer.customer_repository import CustomerRepository
 from .services.demand_generation_service import DemandGenerator
 from .services.routing_service import RoutingEngine
+from .services.osrm_engine import OSRMEngine, AsyncOSRMEngine
+from dqn.settings import FLAGS
 from common.time_utils import get_local_datetime
 from config.settings import OFF_DURATION, PICKUP_DURATION
 from logger import sim_logger
@@ -16,6 +18,9 @@ class Simulator(object):
         self.logger = getLogger(__name__)
         self.demand_generator = DemandGenerator()
         self.routing_engine = RoutingEngine.create_engine()
+        self.async_routing_engine = None
+        if FLAGS.async_routing and isinstance(self.routing_engine, OSRMEngine):
+            self.async_routing_engine = AsyncOSRMEngine(self.routing_engine)
         self.route_cache = {}
 
     def reset(self, start_time=None, timestep=None):
@@ -25,6 +30,13 @@ class Simulator(object):
             self.__dt = timestep
         VehicleRepository.init()
         CustomerRepository.init()
+        self.pending_routes = None
+
+
+    def close(self):
+        self.demand_generator.close()
+        if self.async_routing_engine is not None:
+            self.async_routing_engine.close()
 
 
     def populate_vehicle(self, vehicle_id, location):
@@ -32,17 +44,14 @@ class Simulator(object):
 
 
     def step(self):
-        for customer in CustomerRepository.get_all():
-            customer.step(self.__dt)
-            if customer.is_arrived() or customer.is_disappeared():
-                CustomerRepository.delete(customer.get_id())
-
-        for vehicle in VehicleRepository.get_all():
-            vehicle.step(self.__dt)
-            if vehicle.exit_market():
-                score = ','.join(map(str, [self.get_current_time(), vehicle.get_id()] + vehicle.get_score()))
-                sim_logger.log_score(score)
-                VehicleRepository.delete(vehicle.get_id())
+        CustomerRepository.step(self.__dt)
+
+        VehicleRepository.step(self.__dt)
+        for vehicle in VehicleRepository.get_exiting():
+            score = ','.join(map(str, [self.get_current_time(), vehicle.get_id()] + vehicle.get_score()))
+            sim_logger.log_score(score)
+            VehicleRepository.delete(vehicle.get_id())
+        self.__apply_pending_routes()
 
         self.__populate_new_customers()
         self.__update_time()
@@ -84,13 +93,31 @@ class Simulator(object):
             else:
                 vehicles.append(vehicle)
                 od_pairs.append((vehicle.get_location(), command["destination"]))
-        routes = self.routing_engine.route(od_pairs)
 
+        if self.async_routing_engine is not None:
+            # routes are collected in the next step after customers and vehicles are updated
+            future = self.async_routing_engine.submit(self.async_routing_engine.route(od_pairs))
+            self.pending_routes = ([vehicle.get_id() for vehicle in vehicles], future)
+            return
+
+        routes = self.routing_engine.route(od_pairs)
         for vehicle, (route, triptime) in zip(vehicles, routes):
             if triptime == 0:
                 continue
             vehicle.cruise(route, triptime)
 
+    def __apply_pending_routes(self):
+        if self.pending_routes is None:
+            return
+        vehicle_ids, future = self.pending_routes
+        self.pending_routes = None
+        for vehicle_id, (route, triptime) in zip(vehicle_ids, future.result()):
+            vehicle = VehicleRepository.get(vehicle_id)
+            # vehicles may have exited the market while their routes were requested
+            if vehicle is None or not vehicle.is_available() or triptime == 0:
+                continue
+            vehicle.cruise(route, triptime)
+
     def __update_time(self):
         self.__t += self.__dt
 
@@ -114,6 +141,9 @@ class Simulator(object):
     def get_vehicles_state(self):
         return VehicleRepository.get_states()
 
+    def get_vehicle_index(self):
+        return VehicleRepository.get_index()
+
 
     # def log_score(self):
     #     for vehicle in VehicleRepository.get_all():
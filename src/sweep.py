@@ -0,0 +1,144 @@
+"""Parameter sweep of simulations over a grid of flags and matching policy parameters.
+Points run in a pool of worker processes which keep the network, the routing engine and cached filters
+loaded across points. The KPIs of completed points are written to a results file after each point,
+so that an interrupted sweep resumes with the remaining points."""
+import os
+import shutil
+import itertools
+from contextlib import contextmanager
+from collections import OrderedDict
+import multiprocessing as mp
+import pandas as pd
+from experiment import Experiment
+from evaluation import create_matching_policy, simulate_days, init_worker, get_worker_dispatch_policy
+from dqn.dqn_policy import DQNDispatchPolicy
+from dqn.settings import FLAGS
+from config.settings import TIMESTEP
+from simulator.services.routing_service import RoutingEngine
+from common.cache import compute_digest
+from logger import sim_logger
+
+RESULTS_FILE = "results.csv"
+
+# flags read when the network and the features are built, which can not change between points
+STATIC_FLAGS = ['train', 'load_network', 'n_diffusions', 'average', 'trip_diffusion', 'use_osrm']
+
+
+def expand_grid(grid):
+    """Returns (key, point) of every combination of the values in grid, a dict of name -> list of values.
+    Keys identify points across runs regardless of the order of the grid."""
+    names = sorted(grid)
+    values = [v if isinstance(v, list) else [v] for v in (grid[name] for name in names)]
+    points = []
+    for combination in itertools.product(*values):
+        point = dict(zip(names, combination))
+        points.append((compute_digest(sorted(point.items()))[:16], point))
+    return points
+
+
+def split_params(point):
+    """Splits a point into flags and matching policy parameters"""
+    flag_params = {}
+    matching_params = {}
+    for name, value in point.items():
+        if name in STATIC_FLAGS:
+            raise ValueError("{} can not be swept".format(name))
+        if hasattr(FLAGS, name):
+            flag_params[name] = value
+        else:
+            matching_params[name] = value
+    return flag_params, matching_params
+
+
+@contextmanager
+def override_flags(flag_params):
+    """Sets flags within the block and restores their values after it, so that they do not leak to the next point"""
+    saved = {name: getattr(FLAGS, name) for name in flag_params}
+    try:
+        for name, value in flag_params.items():
+            setattr(FLAGS, name, value)
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(FLAGS, name, value)
+
+
+def run_point(task):
+    """Simulates n_days days from start_time with the parameters of point, logging into log_dir"""
+    key, point, start_time, n_days, log_dir = task
+    # logs of an interrupted run of the point are appended to otherwise
+    if os.path.exists(log_dir):
+        shutil.rmtree(log_dir)
+    os.makedirs(log_dir)
+    sim_logger.set_log_dir(log_dir)
+
+    flag_params, matching_params = split_params(point)
+    with override_flags(flag_params):
+        experiment = Experiment(start_time, TIMESTEP, get_worker_dispatch_policy(), create_matching_policy(**matching_params))
+        try:
+            simulate_days(experiment, n_days, FLAGS.verbose)
+        finally:
+            experiment.close()
+    return key
+
+
+def load_results(output_dir):
+    """Returns rows of the points completed in output_dir by key"""
+    path = os.path.join(output_dir, RESULTS_FILE)
+    rows = OrderedDict()
+    if os.path.exists(path):
+        results = pd.read_csv(path, index_col="key", dtype={"key": str})
+        for key in results.index:
+            rows[key] = OrderedDict((name, results.at[key, name]) for name in results.columns)
+    return rows
+
+
+def to_frame(rows):
+    """One row per point with its parameters followed by its KPIs"""
+    columns = []
+    for row in rows.values():
+        columns += [name for name in row if name not in columns]
+    return pd.DataFrame(list(rows.values()), index=list(rows.keys()), columns=columns)
+
+
+def save_results(results, output_dir):
+    path = os.path.join(output_dir, RESULTS_FILE)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    results.to_csv(tmp_path, index_label="key")
+    os.replace(tmp_path, path)
+
+
+def run_sweep(grid, output_dir, analyze, start_time, n_days, n_workers, load_network=None):
+    """Runs the points of grid not found in the results of output_dir and returns the results of all points,
+    one row per point with its parameters and the KPIs returned by analyze(log_dir)"""
+    points = expand_grid(grid)
+    for _, point in points:
+        split_params(point)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    rows = load_results(output_dir)
+    point_dict = dict(points)
+    tasks = [(key, point, start_time, n_days, os.path.join(output_dir, "points", key))
+             for key, point in points if key not in rows]
+    print("{} points, {} done".format(len(points), len(points) - len(tasks)), flush=True)
+
+    if tasks:
+        # computes cached filters and distances once so that workers only map them
+        DQNDispatchPolicy()
+        RoutingEngine.create_engine()
+
+        # workers are spawned so that each one creates its own TensorFlow session
+        context = mp.get_context('spawn')
+        pool = context.Pool(min(n_workers, len(tasks)), initializer=init_worker, initargs=(load_network,))
+        try:
+            for key in pool.imap_unordered(run_point, tasks):
+                row = OrderedDict(sorted(point_dict[key].items()))
+                row.update(analyze(os.path.join(output_dir, "points", key)))
+                rows[key] = row
+                save_results(to_frame(rows), output_dir)
+                print("Finished: {} {}".format(key, point_dict[key]), flush=True)
+        finally:
+            pool.close()
+            pool.join()
+
+    return to_frame(OrderedDict((key, rows[key]) for key, _ in points))
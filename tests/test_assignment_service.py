@@ -0,0 +1,111 @@
+import itertools
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+from agent.services.assignment_service import solve_assignment
+
+
+def random_costs(rng, n_rows, n_cols, p_infeasible):
+    T = rng.randint(0, 100, size=(n_rows, n_cols)).astype(float)
+    T[rng.rand(n_rows, n_cols) < p_infeasible] = np.inf
+    return T
+
+
+def solve_dense(T):
+    """Solves the assignment on the finite edges of T as the matching policy does"""
+    rows, cols = np.nonzero(np.isfinite(T))
+    edges = solve_assignment(rows, cols, T[rows, cols], T.shape[0], T.shape[1])
+    assert len(set(rows[edges])) == len(edges)
+    assert len(set(cols[edges])) == len(edges)
+    return len(edges), T[rows[edges], cols[edges]].sum()
+
+
+def solve_scipy(T):
+    # infeasible edges cost more than any feasible assignment, so the most feasible edges are taken first
+    M = np.where(np.isfinite(T), T, 0).sum() + 1
+    r, c = linear_sum_assignment(np.where(np.isfinite(T), T, M))
+    feasible = np.isfinite(T[r, c])
+    return np.count_nonzero(feasible), T[r[feasible], c[feasible]].sum()
+
+
+def solve_brute_force(T):
+    """Most edges with the least cost over all partial assignments of rows to columns"""
+    n_rows, n_cols = T.shape
+    best = (0, 0.0)
+    for cols in itertools.permutations(list(range(n_cols)) + [None] * n_rows, n_rows):
+        taken = [(r, c) for r, c in enumerate(cols) if c is not None and np.isfinite(T[r, c])]
+        n, cost = len(taken), sum(T[r, c] for r, c in taken)
+        if n > best[0] or (n == best[0] and cost < best[1]):
+            best = (n, cost)
+    return best
+
+
+@pytest.mark.parametrize("n_rows,n_cols", [(30, 30), (10, 40), (40, 10), (1, 20), (20, 1)])
+@pytest.mark.parametrize("p_infeasible", [0.0, 0.5, 0.9])
+def test_matches_linear_sum_assignment(n_rows, n_cols, p_infeasible):
+    rng = np.random.RandomState(n_rows * 100 + n_cols + int(p_infeasible * 10))
+    for _ in range(5):
+        T = random_costs(rng, n_rows, n_cols, p_infeasible)
+        assert solve_dense(T) == solve_scipy(T)
+
+
+@pytest.mark.parametrize("n_rows,n_cols", [(3, 3), (2, 5), (5, 2), (4, 4)])
+def test_matches_brute_force(n_rows, n_cols):
+    rng = np.random.RandomState(n_rows * 10 + n_cols)
+    for _ in range(20):
+        T = random_costs(rng, n_rows, n_cols, 0.4)
+        assert solve_dense(T) == solve_brute_force(T)
+
+
+def test_multiple_components():
+    rng = np.random.RandomState(0)
+    blocks = [random_costs(rng, n_rows, n_cols, 0.3) for n_rows, n_cols in [(3, 4), (1, 3), (4, 1), (5, 2), (2, 2)]]
+    # rows and columns of blocks are interleaved so that components are not contiguous ranges
+    n_rows, n_cols = sum(B.shape[0] for B in blocks), sum(B.shape[1] for B in blocks)
+    row_order, col_order = rng.permutation(n_rows), rng.permutation(n_cols)
+    T = np.full((n_rows + 2, n_cols + 3), np.inf)
+    r0 = c0 = 0
+    for B in blocks:
+        T[np.ix_(row_order[r0:r0 + B.shape[0]], col_order[c0:c0 + B.shape[1]])] = B
+        r0, c0 = r0 + B.shape[0], c0 + B.shape[1]
+
+    expected = [solve_brute_force(B) for B in blocks]
+    n, cost = solve_dense(T)
+    assert n == sum(e[0] for e in expected)
+    assert cost == sum(e[1] for e in expected)
+    assert (n, cost) == solve_scipy(T)
+
+
+def test_no_edges():
+    assert len(solve_assignment([], [], [], 3, 4)) == 0
+    assert solve_dense(np.full((3, 4), np.inf)) == (0, 0.0)
+
+
+def test_single_row_takes_cheapest_edge():
+    rows, cols, costs = [0, 0, 0], [2, 0, 1], [30.0, 10.0, 20.0]
+    assert solve_assignment(rows, cols, costs, 1, 3).tolist() == [1]
+
+
+def test_float_costs_are_not_rounded():
+    # rounded to whole seconds, the diagonal would cost 1 and look cheaper than the optimal 1.2
+    T = np.array([[0.4, 0.6], [0.6, 1.4]])
+    rows, cols = np.nonzero(np.isfinite(T))
+    edges = solve_assignment(rows, cols, T[rows, cols], 2, 2)
+    assert sorted(zip(rows[edges].tolist(), cols[edges].tolist())) == [(0, 1), (1, 0)]
+
+
+def test_float_costs_match_linear_sum_assignment():
+    rng = np.random.RandomState(7)
+    for n_rows, n_cols in [(20, 20), (8, 25), (25, 8)]:
+        T = rng.rand(n_rows, n_cols) * 600
+        T[rng.rand(n_rows, n_cols) < 0.6] = np.inf
+        n, cost = solve_dense(T)
+        expected_n, expected_cost = solve_scipy(T)
+        assert n == expected_n
+        assert np.isclose(cost, expected_cost)
+
+
+def test_parallel_edges_take_the_cheapest():
+    rows, cols, costs = [0, 0, 1, 1], [0, 0, 1, 0], [50.0, 20.0, 10.0, 5.0]
+    edges = solve_assignment(rows, cols, costs, 2, 2)
+    assert sorted(edges.tolist()) == [1, 2]
@@ -0,0 +1,45 @@
+import threading
+import time
+from simulator.services.async_requester import AsyncRequester
+
+
+class RecordingSession(object):
+    """Session answering each url with the thread that used the session"""
+
+    def __init__(self):
+        self.threads = set()
+
+    def get(self, url, timeout=None):
+        self.threads.add(threading.get_ident())
+        time.sleep(0.001)
+        return self
+
+    def json(self):
+        return {"thread": threading.get_ident()}
+
+
+class RecordingRequester(AsyncRequester):
+
+    def __init__(self, n_threads):
+        super().__init__(n_threads)
+        self.sessions = []
+
+    def create_session(self):
+        session = RecordingSession()
+        self.sessions.append(session)
+        return session
+
+
+def test_each_thread_uses_its_own_session():
+    requester = RecordingRequester(4)
+    for _ in range(3):
+        responses = requester.send_async_requests(["http://osrm/{}".format(i) for i in range(50)])
+        assert len(responses) == 50
+    assert 1 <= len(requester.sessions) <= 4
+    assert all(len(session.threads) == 1 for session in requester.sessions)
+
+
+def test_single_url_is_requested_in_calling_thread():
+    requester = RecordingRequester(4)
+    assert requester.send_async_requests(["http://osrm/0"]) == [{"thread": threading.get_ident()}]
+    assert requester.get_session() is requester.sessions[0]
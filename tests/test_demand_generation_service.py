@@ -0,0 +1,64 @@
+import threading
+import time
+from concurrent import futures
+import pandas as pd
+from simulator.models.customer.customer_batch import request_column_names
+from simulator.services.demand_generation_service import DemandGenerator, RequestChunk
+
+
+class BlockingDemandGenerator(DemandGenerator):
+    """Loads empty chunks; prefetches block until released"""
+
+    def __init__(self):
+        super().__init__(chunk_size=3600)
+        self.release = threading.Event()
+        self.loaded = []
+
+    def load_chunk(self, t1, t2):
+        if self.chunk is not None:
+            self.release.wait()
+        self.loaded.append(t1)
+        return RequestChunk(t1, t2, pd.DataFrame(columns=request_column_names))
+
+
+def test_close_cancels_queued_prefetch():
+    generator = BlockingDemandGenerator()
+    # keeps the loader thread busy so that the prefetch waits in the queue
+    generator.executor = futures.ThreadPoolExecutor(max_workers=1)
+    busy = generator.executor.submit(generator.release.wait)
+    generator.get_chunk(0)
+    prefetch = generator.next_chunk[1]
+
+    generator.close()
+    assert prefetch.cancelled()
+    assert generator.next_chunk is None
+    generator.release.set()
+    busy.result(timeout=5)
+    assert generator.loaded == [0]
+
+
+def test_close_does_not_wait_for_running_prefetch():
+    generator = BlockingDemandGenerator()
+    generator.get_chunk(0)
+    prefetch = generator.next_chunk[1]
+    while not prefetch.running():
+        time.sleep(0.01)
+
+    start = time.time()
+    generator.close()
+    assert time.time() - start < 1
+    generator.release.set()
+    prefetch.result(timeout=5)
+
+
+def test_executor_is_created_on_first_prefetch():
+    generator = BlockingDemandGenerator()
+    assert generator.executor is None
+    generator.close()
+
+    generator.release.set()
+    generator.get_chunk(0)
+    assert generator.executor is not None
+    generator.next_chunk[1].result(timeout=5)
+    generator.close()
+    assert generator.executor is None
@@ -0,0 +1,73 @@
+import os
+from collections import deque
+import numpy as np
+import pytest
+from dqn.experience_memory import ExperienceMemory
+
+NAMES = [name for name, _ in ExperienceMemory.columns]
+
+
+def random_transition(rng):
+    t = int(rng.randint(0, 10 ** 6))
+    return (t, int(rng.randint(100)), int(rng.randint(100)), int(rng.randint(-7, 8)), int(rng.randint(-7, 8)),
+            t + int(rng.randint(60, 3600)), int(rng.randint(100)), int(rng.randint(100)), float(rng.randint(-50, 50)), True)
+
+
+def to_batch(transitions):
+    return {name: np.array([tr[i] for tr in transitions], dtype=dtype)
+            for i, (name, dtype) in enumerate(ExperienceMemory.columns)}
+
+
+def check(memory, model):
+    """The memory holds the transitions of the model in the order they were appended"""
+    assert len(memory) == len(model)
+    assert memory.n_invalid == sum(1 for tr in model if not tr[-1])
+    batch = memory.get(memory.get_ordered_rows())
+    assert [tuple(batch[name][i].item() for name in NAMES) for i in range(len(memory))] == list(model)
+    if model:
+        assert memory.get_period() == (model[0][0], model[-1][0])
+
+
+@pytest.mark.parametrize("capacity,initial_capacity", [(1, 1), (7, 2), (64, 1024), (100, 8)])
+def test_operations_match_deque(capacity, initial_capacity, tmpdir):
+    rng = np.random.RandomState(capacity)
+    memory = ExperienceMemory(capacity, initial_capacity=initial_capacity)
+    model = deque(maxlen=capacity)
+
+    for step in range(400):
+        op = rng.choice(["append", "extend", "invalidate", "compact", "save_load", "clear"],
+                        p=[0.4, 0.25, 0.15, 0.1, 0.07, 0.03])
+        if op == "append":
+            tr = random_transition(rng)
+            memory.append(tr[0], tr[1:3], tr[3:5], tr[5], tr[6:8], tr[8])
+            model.append(tr)
+        elif op == "extend":
+            transitions = [random_transition(rng) for _ in range(rng.randint(0, capacity * 3))]
+            memory.extend(to_batch(transitions))
+            model.extend(transitions)
+        elif op == "invalidate" and model:
+            positions = rng.randint(0, len(model), rng.randint(1, len(model) + 1))
+            memory.invalidate(memory.get_ordered_rows()[positions])
+            for i in positions:
+                model[i] = model[i][:-1] + (False,)
+        elif op == "compact":
+            memory.compact()
+            model = deque([tr for tr in model if tr[-1]], maxlen=capacity)
+        elif op == "save_load":
+            path = os.path.join(str(tmpdir), str(step))
+            memory.save(path)
+            assert ExperienceMemory.exists(path)
+            # loading into a smaller capacity keeps the newest transitions
+            capacity = capacity if rng.rand() < 0.5 else rng.randint(1, capacity + 1)
+            memory = ExperienceMemory.load(path, capacity)
+            model = deque([tr for tr in model if tr[-1]][-capacity:], maxlen=capacity)
+        elif op == "clear":
+            memory.clear()
+            model.clear()
+        check(memory, model)
+
+
+def test_extend_with_empty_batch():
+    memory = ExperienceMemory(4)
+    memory.extend(to_batch([]))
+    assert len(memory) == 0
@@ -0,0 +1,46 @@
+import threading
+import time
+import numpy as np
+from dqn.learner_process import LearnerProcess, STOP
+
+# as large as the weights of the dispatch network
+N_WEIGHTS = 16101
+
+
+def publish_until_stopped(message_queue, state_queue):
+    """Learner which publishes a state after every training step until it is stopped"""
+    n_steps = 0
+    while True:
+        state_queue.put((n_steps, 0.1, [np.zeros(N_WEIGHTS, dtype=np.float32)]))
+        n_steps += 1
+        time.sleep(0.01)
+        while not message_queue.empty():
+            kind, _ = message_queue.get()
+            if kind == STOP:
+                return
+
+
+def close_within(learner, timeout):
+    thread = threading.Thread(target=learner.close, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def test_close_while_learner_publishes():
+    learner = LearnerProcess(publish_until_stopped)
+    n_steps, epsilon, weights = learner.receive_state(block=True)
+    assert len(weights[0]) == N_WEIGHTS
+    # lets unread states fill the pipe
+    learner.process.join(timeout=1)
+
+    assert close_within(learner, timeout=30)
+    assert learner.process.exitcode == 0
+
+
+def test_close_idle_learner():
+    learner = LearnerProcess(publish_until_stopped)
+    learner.receive_state(block=True)
+
+    assert close_within(learner, timeout=30)
+    assert not learner.process.is_alive()
@@ -0,0 +1,107 @@
+import os
+import pandas as pd
+from logger.merge import merge_logs
+
+DAY = 3600 * 24
+HOUR = 3600
+START = 1464753600 + HOUR * 5
+N_VEHICLES = 4
+
+customer_cols = ["t", "id", "status", "waiting_time"]
+summary_cols = ["t", "n_vehicles", "occupied_vehicles", "n_requests", "n_matching", "n_dispatch", "average_wt"]
+score_cols = ["t", "vehicle_id", "working_time", "earning", "idle", "cruising", "occupied", "assigned", "offduty"]
+vehicle_cols = ["t", "id", "status"]
+
+
+def simulate(log_dir, start_time, end_time, populations):
+    """Writes logs of a simulation from start_time to end_time: a request each minute, and vehicles of each
+    (population time, first vehicle id) entering within 4 hours and exiting after 20 to 21 hours of work.
+    Records depend only on time and the rank of a vehicle in its population, as if simulations were identical."""
+    os.makedirs(log_dir)
+    with open(os.path.join(log_dir, "customer.log"), "w") as customer, \
+            open(os.path.join(log_dir, "summary.log"), "w") as summary:
+        for t in range(start_time, end_time, 60):
+            i = t // 60
+            customer.write("{},{},{},{}\n".format(t, i, 4 if i % 7 == 0 else 2, i * 37 % 600))
+            summary.write("{}, {}, {}, 1, {}, 0, {}\n".format(t, i % 100, i % 50, int(i % 7 != 0), i * 37 % 600))
+
+    with open(os.path.join(log_dir, "vehicle.log"), "w") as vehicle, \
+            open(os.path.join(log_dir, "score.log"), "w") as score:
+        for population_time, first_id in populations:
+            for rank in range(N_VEHICLES):
+                vehicle_id = first_id + rank
+                enter = population_time + rank * HOUR
+                exit = enter + HOUR * 20 + rank * 900
+                for t in range(max(enter, start_time), min(exit, end_time), 600):
+                    vehicle.write("{},{},{}\n".format(t, vehicle_id, (t // 600 + rank) % 3))
+                if exit < end_time:
+                    working_time = exit - enter
+                    score.write("{},{},{},{},0,{},{},0,{}\n".format(
+                        exit, vehicle_id, working_time, 300 + rank * 10, 3600 * 3, 3600 * 12, 1800))
+
+
+def load(log_dir, name, cols):
+    df = pd.read_csv(os.path.join(log_dir, name), names=cols)
+    if "vehicle_id" in df:
+        df = df.drop("vehicle_id", axis=1)
+    if "id" in df and name == "vehicle.log":
+        df = df.drop("id", axis=1)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def kpis(log_dir):
+    score = load(log_dir, "score.log", score_cols)
+    c = load(log_dir, "customer.log", customer_cols)
+    working_hour = (score.working_time - score.offduty) / 3600
+    return {
+        "reject_rate": float(len(c[c.status == 4])) / len(c) * 100,
+        "revenue/hour": (score.earning / working_hour).mean(),
+        "waiting_time": c[c.status == 2].waiting_time.mean(),
+        "n_requests": load(log_dir, "summary.log", summary_cols).n_requests.sum()
+    }
+
+
+def simulate_two_days(tmpdir):
+    sequential = os.path.join(tmpdir, "sequential")
+    simulate(sequential, START, START + DAY * 2 + HOUR,
+             [(START, 1), (START + DAY, 1 + N_VEHICLES), (START + DAY * 2, 1 + N_VEHICLES * 2)])
+    days = []
+    for day in range(2):
+        day_start = START + DAY * day
+        first_id = 1 + day * N_VEHICLES * 2
+        days.append(os.path.join(tmpdir, "days", str(day)))
+        simulate(days[-1], day_start, day_start + DAY + HOUR, [(day_start, first_id), (day_start + DAY, first_id + N_VEHICLES)])
+    return sequential, days
+
+
+def test_merged_days_match_sequential_run(tmpdir):
+    sequential, days = simulate_two_days(str(tmpdir))
+    merged = os.path.join(str(tmpdir), "sim")
+    merge_logs(days, merged, [(START + DAY, 1 + N_VEHICLES), None])
+
+    for name, cols in [("customer.log", customer_cols), ("summary.log", summary_cols),
+                       ("score.log", score_cols), ("vehicle.log", vehicle_cols)]:
+        pd.testing.assert_frame_equal(load(merged, name, cols), load(sequential, name, cols))
+    assert kpis(merged) == kpis(sequential)
+
+
+def test_concatenated_days_count_the_overlap_twice(tmpdir):
+    sequential, days = simulate_two_days(str(tmpdir))
+    merged = os.path.join(str(tmpdir), "sim")
+    merge_logs(days, merged)
+
+    customers = load(merged, "customer.log", customer_cols)
+    assert len(customers) == len(load(sequential, "customer.log", customer_cols)) + 60
+    assert kpis(merged)["n_requests"] == kpis(sequential)["n_requests"] + 60
+
+
+def test_rotated_logs_are_merged_oldest_first(tmpdir):
+    log_dir = os.path.join(str(tmpdir), "day")
+    os.makedirs(log_dir)
+    for suffix, t in [(".2", START), (".1", START + 60), ("", START + 120)]:
+        with open(os.path.join(log_dir, "customer.log" + suffix), "w") as f:
+            f.write("{},1,2,0\n".format(t))
+    merged = os.path.join(str(tmpdir), "sim")
+    merge_logs([log_dir], merged, [(START + 120, 1)])
+
+    assert load(merged, "customer.log", customer_cols).t.tolist() == [START, START + 60]
@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+from simulator.services.osrm_engine import OSRMEngine, AsyncOSRMEngine
+
+
+def create_engine():
+    # queries are built without the requester and the cache
+    engine = object.__new__(OSRMEngine)
+    engine.precision = 5
+    return engine
+
+
+def test_eta_many_to_many_parses_durations():
+    problems = [([(40.75, -73.98)], [(40.76, -73.97), (40.77, -73.96)])]
+    keys, create_url, parse = create_engine().eta_many_to_many_queries(problems)
+    assert len(keys) == 1
+    assert "sources=0&destinations=1;2" in create_url(0)
+    assert parse({"code": "Ok", "durations": [[120.5, 300.0]]}) == [[120.5, 300.0]]
+
+
+def test_eta_many_to_many_failure_raises_value_error():
+    _, _, parse = create_engine().eta_many_to_many_queries([([(40.75, -73.98)], [(40.76, -73.97)])])
+    with pytest.raises(ValueError, match="NoTable"):
+        parse({"code": "NoTable", "message": "No table found"})
+
+
+def test_async_engine_close_cancels_pending_queries():
+    async_engine = AsyncOSRMEngine(create_engine())
+    assert async_engine.submit(asyncio.sleep(0, result=1)).result(timeout=5) == 1
+    pending = async_engine.submit(asyncio.sleep(3600))
+
+    async_engine.close()
+    assert not async_engine.thread.is_alive()
+    assert async_engine.loop.is_closed()
+    assert pending.cancelled()
+    async_engine.close()
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from simulator.services.request_backlog import write_request_backlog, RequestBacklog, Request
+
+T0 = 1464753600
+
+
+def create_requests(request_datetime):
+    n = len(request_datetime)
+    rng = np.random.RandomState(n)
+    df = pd.DataFrame({
+        'id': np.arange(n) + 1,
+        'request_datetime': request_datetime,
+        'trip_time': rng.randint(60, 3600, n),
+        'origin_lon': rng.rand(n),
+        'origin_lat': rng.rand(n),
+        'destination_lon': rng.rand(n),
+        'destination_lat': rng.rand(n),
+        'fare': rng.rand(n) * 50
+    }, columns=list(Request._fields))
+    return df.set_index('id')
+
+
+def open_backlog(tmpdir, request_datetime, bucket=60):
+    path = str(tmpdir)
+    write_request_backlog(create_requests(np.asarray(request_datetime, dtype=np.int64)), path, bucket)
+    assert RequestBacklog.exists(path)
+    return RequestBacklog(path)
+
+
+def slice_column(backlog, name, t1, t2):
+    """Values of a column over the rows of requests in [t1, t2) located in the backlog"""
+    column = backlog.columns[Request._fields.index(name)]
+    return np.array(column[backlog.locate(t1):backlog.locate(t2)])
+
+
+def check_locate(backlog, ts):
+    times = np.sort(np.asarray(backlog.request_datetime))
+    for t in ts:
+        assert backlog.locate(t) == np.searchsorted(times, t, side='left'), t
+
+
+def test_empty_backlog(tmpdir):
+    backlog = open_backlog(tmpdir, [])
+    check_locate(backlog, [-60, 0, T0, T0 + 3600])
+    assert len(slice_column(backlog, 'id', T0, T0 + 3600)) == 0
+
+
+def test_before_first_and_after_last_row(tmpdir):
+    backlog = open_backlog(tmpdir, [T0 + 90, T0 + 150, T0 + 600])
+    check_locate(backlog, [0, T0, T0 + 89, T0 + 90, T0 + 600, T0 + 601, T0 + 660, T0 + 3600 * 24 * 365])
+    assert backlog.locate(T0 - 3600) == 0
+    assert backlog.locate(T0 + 601) == 3
+
+
+def test_empty_range(tmpdir):
+    backlog = open_backlog(tmpdir, [T0, T0 + 10, T0 + 500])
+    for t1, t2 in [(T0 + 11, T0 + 500), (T0 + 100, T0 + 100), (T0 + 501, T0 + 1000), (T0 - 100, T0)]:
+        assert len(slice_column(backlog, 'id', t1, t2)) == 0
+
+
+def test_equal_timestamps(tmpdir):
+    # requests at the same time, at bucket boundaries and filling whole buckets
+    request_datetime = [T0] * 5 + [T0 + 59] * 2 + [T0 + 60] * 4 + [T0 + 300] * 3
+    backlog = open_backlog(tmpdir, request_datetime)
+    check_locate(backlog, range(T0 - 61, T0 + 400))
+    assert backlog.locate(T0) == 0
+    assert backlog.locate(T0 + 60) == 7
+    assert backlog.locate(T0 + 61) == 11
+    ids = slice_column(backlog, 'id', T0 + 60, T0 + 301)
+    assert sorted(ids.tolist()) == list(range(8, 15))
+
+
+@pytest.mark.parametrize("bucket", [1, 60, 7200])
+def test_ranges_match_frame(tmpdir, bucket):
+    rng = np.random.RandomState(bucket)
+    df = create_requests(T0 + rng.randint(0, 3600 * 5, 500) // 30 * 30)
+    path = str(tmpdir)
+    write_request_backlog(df, path, bucket)
+    backlog = RequestBacklog(path)
+    for _ in range(50):
+        t1 = T0 + rng.randint(-600, 3600 * 6)
+        t2 = t1 + rng.randint(0, 3600)
+        expected = df[(df.request_datetime >= t1) & (df.request_datetime < t2)]
+        assert sorted(slice_column(backlog, 'id', t1, t2).tolist()) == sorted(expected.index.tolist())
+        assert (np.diff(slice_column(backlog, 'request_datetime', t1, t2)) >= 0).all()
@@ -0,0 +1,79 @@
+import numpy as np
+from dqn.supply_demand_history import SupplyDemandHistory
+
+CYCLE = 600
+SHAPE = (5, 4)
+
+
+def random_maps(rng, n):
+    return (rng.rand(n, *SHAPE) * 10).astype(np.float32)
+
+
+def test_identical_maps_share_a_row():
+    rng = np.random.RandomState(0)
+    A, B, C = random_maps(rng, 3)
+    history = SupplyDemandHistory(4, CYCLE, initial_pool_size=1)
+    history.put(0, [A, B, A], (1, 0.5))
+    history.put(CYCLE, [A, C, B], (2, 0.4))
+
+    rows0, rows1 = history.map_rows[0].tolist(), history.map_rows[1].tolist()
+    assert rows0[0] == rows0[2] == rows1[0]
+    assert rows0[1] == rows1[2]
+    assert history.n_rows == 3
+    assert history.refcounts[rows0[0]] == 3
+    maps, fingerprint = history.get(CYCLE + 60)
+    np.testing.assert_array_equal(maps, np.array([A, C, B], dtype=np.float16))
+    assert fingerprint == (2, 0.4)
+
+
+def test_freed_rows_are_reused():
+    rng = np.random.RandomState(1)
+    history = SupplyDemandHistory(2, CYCLE)
+    for i in range(10):
+        history.put(i * CYCLE, random_maps(rng, 3), (i, 0.0))
+        # a replaced snapshot frees its rows before the new maps are stored
+        assert history.n_rows == 3 * min(i + 1, 2)
+        assert len(history) == min(i + 1, 2)
+    assert history.get(7 * CYCLE) == (None, None)
+    assert history.contains([8 * CYCLE, 9 * CYCLE + 1, 7 * CYCLE]).tolist() == [True, True, False]
+    assert sorted(history.refcounts[:history.n_rows].tolist()) == [1] * 6
+
+
+def test_maps_survive_save_and_load(tmpdir):
+    rng = np.random.RandomState(2)
+    history = SupplyDemandHistory(8, CYCLE, initial_pool_size=2)
+    snapshots = {}
+    shared = random_maps(rng, 1)[0]
+    for i in range(12):
+        maps = random_maps(rng, 3)
+        maps[1] = shared
+        snapshots[i * CYCLE] = (maps, (i * 100, 1.0 / (i + 1)))
+        history.put(i * CYCLE, maps, snapshots[i * CYCLE][1])
+
+    path = str(tmpdir)
+    history.save(path)
+    assert SupplyDemandHistory.exists(path)
+    loaded = SupplyDemandHistory.load(path)
+    assert len(loaded) == 8
+    for t, (maps, fingerprint) in snapshots.items():
+        loaded_maps, loaded_fingerprint = loaded.get(t)
+        if t < 4 * CYCLE:
+            assert loaded_maps is None
+            continue
+        assert loaded_maps.dtype == np.float16
+        np.testing.assert_allclose(loaded_maps, maps, rtol=2 ** -11)
+        assert loaded_fingerprint == fingerprint
+
+    # puts after load dedupe against the loaded pool and replace the oldest snapshots
+    loaded.put(12 * CYCLE, [shared, shared, random_maps(rng, 1)[0]], (1200, 0.0))
+    assert loaded.get(4 * CYCLE) == (None, None)
+    rows = loaded.map_rows[loaded.get_slot(12 * CYCLE)].tolist()
+    assert rows[0] == rows[1] == loaded.map_rows[loaded.get_slot(5 * CYCLE)][1]
+    np.testing.assert_allclose(loaded.get(5 * CYCLE)[0], snapshots[5 * CYCLE][0], rtol=2 ** -11)
+
+
+def test_save_and_load_empty_history(tmpdir):
+    SupplyDemandHistory(4, CYCLE).save(str(tmpdir))
+    loaded = SupplyDemandHistory.load(str(tmpdir))
+    assert len(loaded) == 0
+    assert loaded.get(0) == (None, None)
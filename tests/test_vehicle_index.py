@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+from common import geoutils
+from config.settings import MIN_LAT, MIN_LON, DELTA_LAT, DELTA_LON, MAP_WIDTH, MAP_HEIGHT
+from simulator.models.vehicle.vehicle_index import VehicleIndex
+
+
+def create_vehicles(rng, n_random=300, n_boundary=200):
+    """Vehicles at random locations in the map, in a dense cluster, and on the edges and corners of cells"""
+    lats = MIN_LAT + rng.rand(n_random) * MAP_HEIGHT * DELTA_LAT
+    lons = MIN_LON + rng.rand(n_random) * MAP_WIDTH * DELTA_LON
+    cluster_lats = MIN_LAT + (MAP_HEIGHT / 2 + rng.rand(100)) * DELTA_LAT
+    cluster_lons = MIN_LON + (MAP_WIDTH / 2 + rng.rand(100)) * DELTA_LON
+    xs, ys = rng.randint(1, MAP_WIDTH, n_boundary), rng.randint(1, MAP_HEIGHT, n_boundary)
+    on_x = rng.rand(n_boundary) < 0.5
+    on_y = ~on_x | (rng.rand(n_boundary) < 0.3)
+    boundary_lats = MIN_LAT + (ys + np.where(on_y, 0, rng.rand(n_boundary))) * DELTA_LAT
+    boundary_lons = MIN_LON + (xs + np.where(on_x, 0, rng.rand(n_boundary))) * DELTA_LON
+    lats = np.concatenate([lats, cluster_lats, boundary_lats])
+    lons = np.concatenate([lons, cluster_lons, boundary_lons])
+    ids = rng.permutation(len(lats) * 3)[:len(lats)] + 1
+    return pd.DataFrame({"lat": lats, "lon": lons}, index=ids)
+
+
+def create_queries(rng, vehicles, n=40):
+    """Random locations, cell corners and locations of vehicles"""
+    queries = [(MIN_LAT + rng.rand() * MAP_HEIGHT * DELTA_LAT, MIN_LON + rng.rand() * MAP_WIDTH * DELTA_LON)
+               for _ in range(n)]
+    queries += [(MIN_LAT + rng.randint(1, MAP_HEIGHT) * DELTA_LAT, MIN_LON + rng.randint(1, MAP_WIDTH) * DELTA_LON)
+                for _ in range(n)]
+    queries += [tuple(vehicles.iloc[i][["lat", "lon"]]) for i in rng.randint(0, len(vehicles), n)]
+    return queries
+
+
+def brute_force(vehicles, lat, lon, max_distance, exclude):
+    d = pd.Series(geoutils.great_circle_distance(lat, lon, vehicles.lat.values, vehicles.lon.values),
+                  index=vehicles.index)
+    d = d[(d < max_distance) & ~d.index.isin(list(exclude))]
+    return d.sort_values(kind='mergesort')
+
+
+def check_result(vehicles, result, expected):
+    ids, latlons, d = result
+    assert len(set(ids.tolist())) == len(ids)
+    assert set(ids.tolist()) <= set(expected.index)
+    np.testing.assert_allclose(d, expected.values[:len(d)])
+    np.testing.assert_allclose(d, expected[ids].values)
+    np.testing.assert_array_equal(latlons, vehicles.loc[ids, ["lat", "lon"]].values)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_knn_matches_brute_force(seed):
+    rng = np.random.RandomState(seed)
+    vehicles = create_vehicles(rng)
+    index = VehicleIndex.from_frame(vehicles)
+    assert len(index) == len(vehicles)
+
+    for lat, lon in create_queries(rng, vehicles):
+        k = int(rng.choice([1, 5, 30, len(vehicles) + 1]))
+        max_distance = float(rng.choice([np.inf, 500, 3000]))
+        exclude = set(rng.choice(vehicles.index, rng.randint(0, 50)).tolist())
+        expected = brute_force(vehicles, lat, lon, max_distance, exclude)
+        result = index.knn(lat, lon, k, max_distance=max_distance, exclude=exclude)
+        assert len(result[0]) == min(k, len(expected))
+        check_result(vehicles, result, expected)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_radius_matches_brute_force(seed):
+    rng = np.random.RandomState(seed + 10)
+    vehicles = create_vehicles(rng)
+    index = VehicleIndex.from_frame(vehicles)
+
+    for lat, lon in create_queries(rng, vehicles):
+        max_distance = float(rng.choice([100, 1000, 5000]))
+        exclude = set(rng.choice(vehicles.index, rng.randint(0, 50)).tolist())
+        expected = brute_force(vehicles, lat, lon, max_distance, exclude)
+        result = index.radius(lat, lon, max_distance, exclude=exclude)
+        assert sorted(result[0].tolist()) == sorted(expected.index.tolist())
+        check_result(vehicles, result, expected)
+
+
+def test_exclude_all_vehicles():
+    rng = np.random.RandomState(0)
+    vehicles = create_vehicles(rng, n_random=20, n_boundary=10)
+    index = VehicleIndex.from_frame(vehicles)
+    lat, lon = vehicles.lat.iloc[0], vehicles.lon.iloc[0]
+    ids, latlons, d = index.knn(lat, lon, 3, exclude=set(vehicles.index))
+    assert len(ids) == 0 and latlons.shape == (0, 2) and len(d) == 0
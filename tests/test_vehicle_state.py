@@ -0,0 +1,39 @@
+from common import vehicle_status_codes
+from simulator.models.vehicle.vehicle_fleet import VehicleFleet
+from simulator.models.vehicle.vehicle_state import VehicleState
+
+LOCATION = (40.75, -73.98)
+
+
+def parse_msg(state):
+    return dict(zip(VehicleState.fields, state.to_msg().split(',')))
+
+
+def test_log_message_keeps_integer_and_null_fields():
+    fleet = VehicleFleet(capacity=1)
+    states = [VehicleState(fleet, vehicle_id, LOCATION) for vehicle_id in [7, 8]]
+    fleet.step(60)
+    fleet.step(60)
+
+    msg = parse_msg(states[0])
+    assert msg['id'] == '7'
+    assert msg['status'] == str(vehicle_status_codes.IDLE)
+    assert msg['assigned_customer_id'] == 'None'
+    assert msg['destination_lat'] == msg['destination_lon'] == 'None'
+    assert msg['idle_duration'] == '120'
+    assert states[1].working_time == 120 and isinstance(states[1].working_time, int)
+
+
+def test_assigned_customer_id_round_trips():
+    fleet = VehicleFleet()
+    state = VehicleState(fleet, 1, LOCATION)
+    state.assigned_customer_id = 12345
+    state.status = vehicle_status_codes.ASSIGNED
+    state.time_to_destination = 300
+    fleet.step(60)
+    msg = parse_msg(state)
+    assert msg['assigned_customer_id'] == '12345'
+    assert msg['idle_duration'] == '0'
+    state.reset_plan()
+    assert state.assigned_customer_id is None
+    assert fleet.assigned_customer_id[state.row] == VehicleFleet.null_values['assigned_customer_id']
@@ -0,0 +1,89 @@
+"""Compares matching policies on synthetic vehicles and requests by wall time and total waiting time.
+
+    python tools/benchmark_matching.py --vehicles 8000 --requests 1000 --trials 5
+    python tools/benchmark_matching.py --stub     # routes with the local OSRM stub instead of tt_map
+
+Remaining arguments are passed to the simulator flags.
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../src/')
+from osrm_stub_server import OSRMStubServer
+from config.settings import CENTER_LATITUDE, CENTER_LONGITUDE
+
+
+def random_vehicles(n, width):
+    index = pd.Index(np.arange(1, n + 1), name="id")
+    return pd.DataFrame({
+        "lat": CENTER_LATITUDE + (np.random.rand(n) - 0.5) * width,
+        "lon": CENTER_LONGITUDE + (np.random.rand(n) - 0.5) * width,
+        "status": 0,
+        "idle_duration": 60.0
+    }, index=index)
+
+
+def random_requests(n, width, n_hotspots=10):
+    """Requests scattered around hotspots so that nearby requests compete for the same vehicles"""
+    hotspots = (np.random.rand(n_hotspots, 2) - 0.5) * width
+    i = np.random.randint(n_hotspots, size=n)
+    index = pd.Index(np.arange(1, n + 1), name="id")
+    return pd.DataFrame({
+        "origin_lat": CENTER_LATITUDE + hotspots[i, 0] + np.random.randn(n) * width / 20,
+        "origin_lon": CENTER_LONGITUDE + hotspots[i, 1] + np.random.randn(n) * width / 20
+    }, index=index)
+
+
+def evaluate(policy, vehicles, requests):
+    t = time.time()
+    commands = policy.match(0, vehicles.copy(), requests)
+    elapsed = time.time() - t
+    waiting_time = sum(command["duration"] for command in commands)
+    return elapsed, len(commands), waiting_time
+
+
+def run(args):
+    from agent.matching_policy import RoughMatchingPolicy, GreedyMatchingPolicy, OptimalMatchingPolicy
+    policies = [
+        ("rough", RoughMatchingPolicy()),
+        ("greedy", GreedyMatchingPolicy()),
+        ("optimal", OptimalMatchingPolicy())
+    ]
+    results = {name: [] for name, _ in policies}
+    for _ in range(args.trials):
+        vehicles = random_vehicles(args.vehicles, args.width)
+        requests = random_requests(args.requests, args.width)
+        for name, policy in policies:
+            results[name].append(evaluate(policy, vehicles, requests))
+
+    print("{:<10s} {:>10s} {:>10s} {:>14s} {:>12s}".format("policy", "time (s)", "matched", "total wait", "mean wait"))
+    for name, _ in policies:
+        elapsed, n_matched, waiting_time = np.mean(results[name], axis=0)
+        print("{:<10s} {:10.3f} {:10.1f} {:14.0f} {:12.1f}".format(
+            name, elapsed, n_matched, waiting_time, waiting_time / max(n_matched, 1)), flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=8000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--width", type=float, default=0.1, help="width of the area in degrees")
+    parser.add_argument("--stub", action="store_true", help="use the local OSRM stub as the routing engine")
+    parser.add_argument("--seed", type=int, default=0)
+    args, flags = parser.parse_known_args()
+    np.random.seed(args.seed)
+    # the simulator flags are parsed from sys.argv on import
+    sys.argv = sys.argv[:1] + flags
+
+    if args.stub:
+        with OSRMStubServer() as server:
+            # OSRM_HOSTPORT is read when the engine module is imported
+            os.environ["OSRM_HOSTPORT"] = server.hostport
+            sys.argv.append("--use_osrm")
+            run(args)
+    else:
+        run(args)
@@ -0,0 +1,50 @@
+"""Measures throughput of OSRMEngine against the local OSRM stub server.
+
+    python tools/benchmark_osrm.py --requests 2000 --threads 8 --latency 0.01
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../src/')
+from osrm_stub_server import OSRMStubServer
+
+
+def random_points(n, center=(40.75, -73.90), width=0.1):
+    lats = center[0] + (np.random.rand(n) - 0.5) * width
+    lons = center[1] + (np.random.rand(n) - 0.5) * width
+    return list(zip(lats.tolist(), lons.tolist()))
+
+
+def measure(name, n, func):
+    t = time.time()
+    func()
+    elapsed = time.time() - t
+    print("{:<20s} {:8d} requests {:8.3f} s {:10.1f} req/s".format(name, n, elapsed, n / elapsed), flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every stub response")
+    args = parser.parse_args()
+
+    with OSRMStubServer(latency=args.latency) as server:
+        # OSRM_HOSTPORT is read when the engine module is imported
+        os.environ["OSRM_HOSTPORT"] = server.hostport
+        from simulator.services.osrm_engine import OSRMEngine, AsyncOSRMEngine
+        engine = OSRMEngine(n_threads=args.threads, cache_size=0)
+        async_engine = AsyncOSRMEngine(engine)
+
+        n = args.requests
+        od_list = list(zip(random_points(n), random_points(n)))
+        measure("route", n, lambda: engine.route(od_list))
+        measure("async route", n, lambda: async_engine.submit(async_engine.route(od_list)).result())
+
+        origin_destins_list = [(o, random_points(10)) for o in random_points(n)]
+        measure("eta_one_to_many", n, lambda: engine.eta_one_to_many(origin_destins_list))
+
+        origins, destins = random_points(80), random_points(40)
+        measure("eta_many_to_many", 100, lambda: [engine.eta_many_to_many(origins, destins) for _ in range(100)])
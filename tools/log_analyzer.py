@@ -213,21 +213,28 @@ class LogAnalyzer(object):
             plt.hist(c[c.status==2].waiting_time, bins=500, range=(0, 650), alpha=0.5, label=label)
             plt.yticks([])
 
-            x = {}
-            x["00_reject_rate"] = float(len(c[c.status == 4])) / len(c) * 100
-            x["01_revenue/hour"] = score.revenue_per_hour.mean()
-            x["02_occupancy_rate"] = score.occupancy_rate.mean()
-            x["03_cruising/day"] = score.cruising_hour.mean()
-            x["04_working/day"] = score.working_hour.mean()
-            x["05_waiting_time"] = c[c.status == 2].waiting_time.mean()
-
-            x["11_revenue/hour(std)"] = score.revenue_per_hour.std()
-            x["12_occupancy_rate(std)"] = score.occupancy_rate.std()
-            x["13_cruising/day(std)"] = score.cruising_hour.std()
-            x["14_working/day(std)"] = score.working_hour.std()
-            x["15_waiting_time(std)"] = c[c.status == 2].waiting_time.std()
-            data.append(x)
+            data.append(self.get_metrics(score, c))
 
         plt.legend()
         df = pd.DataFrame(data, index=labels)
         return plt, df
+
+    def get_metrics(self, score, c):
+        """KPIs of a score log and a customer log, as tabulated by plot_metrics"""
+        x = {}
+        x["00_reject_rate"] = float(len(c[c.status == 4])) / len(c) * 100
+        x["01_revenue/hour"] = score.revenue_per_hour.mean()
+        x["02_occupancy_rate"] = score.occupancy_rate.mean()
+        x["03_cruising/day"] = score.cruising_hour.mean()
+        x["04_working/day"] = score.working_hour.mean()
+        x["05_waiting_time"] = c[c.status == 2].waiting_time.mean()
+
+        x["11_revenue/hour(std)"] = score.revenue_per_hour.std()
+        x["12_occupancy_rate(std)"] = score.occupancy_rate.std()
+        x["13_cruising/day(std)"] = score.cruising_hour.std()
+        x["14_working/day(std)"] = score.working_hour.std()
+        x["15_waiting_time(std)"] = c[c.status == 2].waiting_time.std()
+        return x
+
+    def load_metrics(self, log_dir_path):
+        return self.get_metrics(self.load_score_log(log_dir_path), self.load_customer_log(log_dir_path, skip_minutes=60))
@@ -0,0 +1,127 @@
+"""Local stand-in for the OSRM HTTP API used to benchmark routing without an OSRM backend.
+Routes are straight lines and durations are great circle distances divided by a constant speed."""
+import json
+import sys
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote, parse_qs
+import polyline
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../src/')
+from common.geoutils import great_circle_distance
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class OSRMStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    speed = 8.0     # m/s
+    latency = 0.0   # seconds added to every response
+
+    def do_GET(self):
+        path, coords, query = self.split_path(unquote(self.path))
+        service = path.split('/')[1]
+        params = parse_qs(query)
+        if service == "route":
+            body = self.route(self.parse_coords(coords))
+        elif service == "table":
+            body = self.table(self.parse_coords(coords), params)
+        elif service == "nearest":
+            body = self.nearest(self.parse_coords(coords))
+        else:
+            self.send_error(404)
+            return
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+    def split_path(self, path):
+        """Splits into service path, coordinates and query.
+        Encoded polylines may contain '?', so the query starts after the closing parenthesis."""
+        if "polyline(" in path:
+            head, rest = path.split("polyline(", 1)
+            coords, query = rest.split(")", 1)
+            return head, "polyline(" + coords + ")", query.lstrip("?")
+        path, _, query = path.partition("?")
+        head, _, coords = path.rpartition("/")
+        return head, coords, query
+
+    def parse_coords(self, coords):
+        """Returns list of (lat, lon)"""
+        if coords.startswith("polyline("):
+            return polyline.decode(coords[len("polyline("):-1])
+        return [tuple(map(float, c.split(',')))[::-1] for c in coords.split(';')]
+
+    def duration(self, origin, destin):
+        return float(great_circle_distance(origin[0], origin[1], destin[0], destin[1])) / self.speed
+
+    def route(self, latlons):
+        origin, destin = latlons[0], latlons[-1]
+        return {"code": "Ok", "routes": [{
+            "duration": self.duration(origin, destin),
+            "geometry": polyline.encode([origin, destin])
+        }]}
+
+    def table(self, latlons, params):
+        ids = list(range(len(latlons)))
+        sources = [int(i) for i in params["sources"][0].split(';')] if "sources" in params else ids
+        destins = [int(i) for i in params["destinations"][0].split(';')] if "destinations" in params else ids
+        durations = [[self.duration(latlons[i], latlons[j]) for j in destins] for i in sources]
+        return {"code": "Ok", "durations": durations}
+
+    def nearest(self, latlons):
+        lat, lon = latlons[0]
+        return {"code": "Ok", "waypoints": [{"location": [lon, lat], "distance": 0.0}]}
+
+
+class OSRMStubServer(object):
+    """Runs the stub in a background thread; usable as a context manager"""
+
+    def __init__(self, host="localhost", port=0, latency=0.0):
+        handler = type("Handler", (OSRMStubHandler,), {"latency": latency})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def hostport(self):
+        host, port = self.server.server_address
+        return "{}:{}".format(host, port)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+    server = OSRMStubServer(port=args.port, latency=args.latency)
+    print("serving on {}".format(server.hostport))
+    server.server.serve_forever()
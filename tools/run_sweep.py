@@ -0,0 +1,37 @@
+"""Runs simulations over a grid of parameters and tabulates the KPIs of every point.
+
+    python tools/run_sweep.py grid.json --output logs/sweep --workers 8 --days 1 --load_network logs/test/networks/model-1000
+
+grid.json maps flags such as vehicles, offduty_threshold and alpha, or matching policy parameters such as
+reject_distance and max_locations, to lists of values, e.g. {"vehicles": [6000, 8000], "reject_distance": [3000, 5000]}.
+Running the same command again resumes an interrupted sweep.
+Remaining arguments are passed to the simulator flags.
+"""
+import argparse
+import json
+import os
+import sys
+import multiprocessing as mp
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../src/')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("grid", help="json file of parameter names to lists of values")
+    parser.add_argument("--output", default="logs/sweep", help="directory of the logs and the results of points")
+    parser.add_argument("--workers", type=int, default=mp.cpu_count())
+    args, flags = parser.parse_known_args()
+
+    # the simulator flags are parsed from sys.argv on import
+    sys.argv = sys.argv[:1] + flags
+    from log_analyzer import LogAnalyzer
+    from sweep import run_sweep
+    from dqn.settings import FLAGS
+
+    with open(args.grid) as f:
+        grid = json.load(f)
+    analyzer = LogAnalyzer()
+    start_time = FLAGS.start_time + int(60 * 60 * 24 * FLAGS.start_offset)
+    results = run_sweep(grid, args.output, lambda log_dir: analyzer.load_metrics(log_dir + "/"),
+                        start_time, FLAGS.days, args.workers, FLAGS.load_network)
+    print(results.to_string())